@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import app.usecases.beatmap
+import app.usecases.leaderboards
+import app.usecases.osu_api
 import settings
 from app.models.user import User
 from app.usecases.user import authenticate_user
@@ -111,5 +114,15 @@ async def get_friends(
 @router.get("/api/v1/status")
 async def status_handler():
     return ORJSONResponse(
-        {"status": 200, "server_status": 1},
+        {
+            "status": 200,
+            "server_status": 1,
+            "leaderboards_preloaded": app.usecases.leaderboards.PRELOADED,
+            "caches": {
+                "leaderboards": app.usecases.leaderboards.LEADERBOARD_CACHE.stats,
+                "beatmaps": app.usecases.beatmap.BEATMAP_CACHE.stats,
+            },
+            "beatmap_refresh": app.usecases.beatmap.REFRESH_QUEUE.stats,
+            "osu_api": app.usecases.osu_api.stats(),
+        },
     )
@@ -12,13 +12,77 @@ from app.constants.leaderboard_type import LeaderboardType
 from app.constants.mode import Mode
 from app.constants.mods import Mods
 from app.constants.privileges import Privileges
-from app.models.score import Score
+from app.models.score import LeaderboardScore
 from app.models.user import User
+from app.objects.leaderboard import Leaderboard
+from app.objects.leaderboard import RenderedScores
 from app.usecases.user import authenticate_user
 from fastapi import Depends
 from fastapi import Query
 
 CUR_LB_VER = 4
+MAX_LEADERBOARD_SCORES = 100
+
+SHARED_LEADERBOARD_TYPES = (
+    LeaderboardType.LOCAL,
+    LeaderboardType.TOP,
+    LeaderboardType.MODS,
+)
+
+
+async def select_scores(
+    leaderboard: Leaderboard,
+    leaderboard_type: LeaderboardType,
+    mods: Mods,
+    user: User,
+) -> list[LeaderboardScore]:
+    if leaderboard_type == LeaderboardType.MODS:
+        return await leaderboard.get_mods_scores(
+            mods.value,
+            user.id,
+            limit=MAX_LEADERBOARD_SCORES,
+        )
+
+    if leaderboard_type == LeaderboardType.COUNTRY:
+        return await leaderboard.get_country_scores(
+            user.country,
+            user.id,
+            limit=MAX_LEADERBOARD_SCORES,
+        )
+
+    if leaderboard_type == LeaderboardType.FRIENDS:
+        return await leaderboard.get_friends_scores(
+            user.friends,
+            user.id,
+            limit=MAX_LEADERBOARD_SCORES,
+        )
+
+    return await leaderboard.get_unrestricted_scores(
+        user.id,
+        limit=MAX_LEADERBOARD_SCORES,
+    )
+
+
+async def render_scores(
+    scores: list[LeaderboardScore],
+    show_pp: Optional[bool],
+) -> RenderedScores:
+    display_infos = await app.usecases.display_info.fetch_many(
+        score.user_id for score in scores
+    )
+
+    return RenderedScores(
+        scores=scores,
+        lines=[
+            score.osu_string(
+                display_infos[score.user_id].display_name,
+                rank=idx + 1,
+                show_pp=show_pp,
+            ).encode()
+            for idx, score in enumerate(scores)
+        ],
+        positions={score.user_id: idx for idx, score in enumerate(scores)},
+    )
 
 
 async def get_leaderboard(
@@ -58,19 +122,19 @@ async def get_leaderboard(
         await app.usecases.beatmap.fetch_by_set_id(map_set_id)
 
     beatmap = await app.usecases.beatmap.fetch_by_md5(map_md5)
-    if beatmap and beatmap.deserves_update:
-        beatmap = await app.usecases.beatmap.update_beatmap(beatmap)
+    if beatmap:
+        app.usecases.beatmap.request_update(beatmap)
 
     if not beatmap:
         if has_set_id:
             app.state.cache.UNSUBMITTED.add(map_md5)
-            app.usecases.beatmap.SET_CACHE.pop(map_set_id, None)
+            app.usecases.beatmap.BEATMAP_CACHE.remove_set(map_set_id)
 
             return b"-1|false"
 
         filename = unquote(map_filename)
         if has_set_id:
-            for bmap in app.usecases.beatmap.SET_CACHE[map_set_id]:
+            for bmap in app.usecases.beatmap.set_from_cache(map_set_id) or ():
                 if bmap.filename == filename:
                     map_exists = True
                     break
@@ -94,10 +158,12 @@ async def get_leaderboard(
     if not beatmap.has_leaderboard and not user.privileges & Privileges.USER_DONOR:
         return f"{beatmap.status.value}|false".encode()
 
-    response_lines: list[str] = []
+    response_lines: list[bytes] = []
 
     if requesting_from_editor_song_select:
-        response_lines.append(beatmap.osu_string(score_count=0, rating=beatmap.rating))
+        response_lines.append(
+            beatmap.osu_string(score_count=0, rating=beatmap.rating).encode(),
+        )
     else:
         # real leaderboard, let's get some scores!
         leaderboard = await app.usecases.leaderboards.fetch(beatmap, mode)
@@ -106,70 +172,68 @@ async def get_leaderboard(
             beatmap.osu_string(
                 score_count=len(leaderboard),
                 rating=beatmap.rating,
-            ),
+            ).encode(),
         )
 
         personal_best = await leaderboard.find_user_score(user.id)
         if personal_best:
             response_lines.append(
-                personal_best["score"].osu_string(
+                personal_best["score"]
+                .osu_string(
                     user.name,
                     personal_best["rank"],
                     show_pp=leaderboard_pp,
-                ),
+                )
+                .encode(),
             )
         else:
-            response_lines.append("")
+            response_lines.append(b"")
 
         leaderboard_type = LeaderboardType(leaderboard_type_arg)
 
-        scores: list[Score] = []
-        for score in await leaderboard.get_unrestricted_scores(user.id):
-            if len(scores) >= 100:  # max 100 scores on lb
-                break
-
-            if leaderboard_type == LeaderboardType.MODS and score.mods != mods:
-                continue
-
-            score_country = await app.usecases.countries.get_country(score.user_id)
-            if (
-                leaderboard_type == LeaderboardType.COUNTRY
-                and score_country != user.country
-            ):
-                continue
-
-            if (
-                leaderboard_type == LeaderboardType.FRIENDS
-                and score.user_id not in user.friends
-            ):
-                continue
-
-            scores.append(score)
-
-        # this double loop probably seems pointless
-        # however it's necessary to be able to limit score count and get accurate ranking at the same time
-        for idx, score in enumerate(scores):
-            if score.user_id == user.id:
-                displayed_name = user.name
-            else:
-                score_clan = await app.usecases.clans.fetch(score.user_id)
-                score_username = await app.usecases.usernames.fetch(
-                    score.user_id,
+        # The global and mods leaderboards look the same to every unrestricted
+        # viewer, so their rendered rows may be shared.
+        if (
+            leaderboard_type in SHARED_LEADERBOARD_TYPES
+            and not app.usecases.privileges.is_restricted(user.id)
+        ):
+            render_key = (
+                leaderboard_type == LeaderboardType.MODS,
+                mods.value if leaderboard_type == LeaderboardType.MODS else 0,
+                leaderboard_pp,
+            )
+
+            rendered_cache = leaderboard.rendered
+            rendered = rendered_cache.get(render_key)
+            if rendered is None:
+                rendered = await render_scores(
+                    await select_scores(leaderboard, leaderboard_type, mods, user),
+                    show_pp=leaderboard_pp,
                 )
+                rendered_cache[render_key] = rendered
+        else:
+            rendered = await render_scores(
+                await select_scores(leaderboard, leaderboard_type, mods, user),
+                show_pp=leaderboard_pp,
+            )
 
-                if score_clan:
-                    displayed_name = f"[{score_clan}] {score_username}"
-                else:
-                    displayed_name = score_username
+        score_lines = rendered.lines
 
-            response_lines.append(
-                score.osu_string(displayed_name, rank=idx + 1, show_pp=leaderboard_pp),
+        # the user's own score is displayed without their clan tag.
+        if (user_idx := rendered.positions.get(user.id)) is not None:
+            score_lines = score_lines.copy()
+            score_lines[user_idx] = (
+                rendered.scores[user_idx]
+                .osu_string(user.name, rank=user_idx + 1, show_pp=leaderboard_pp)
+                .encode()
             )
 
+        response_lines.extend(score_lines)
+
     end = time.perf_counter_ns()
     formatted_time = app.utils.format_time(end - start)
     logger.info(
         f"Served {user} leaderboard for {beatmap.song_name} in {formatted_time}",
     )
 
-    return "\n".join(response_lines).encode()
+    return b"\n".join(response_lines)
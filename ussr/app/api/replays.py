@@ -1,7 +1,5 @@
 from __future__ import annotations
 
-import asyncio
-
 import app.state
 import app.usecases
 import app.utils
@@ -37,9 +35,7 @@ async def get_replay(
         logger.error(f"Requested replay ID {score_id}, but no file could be found.")
         return b"error: no"
 
-    asyncio.create_task(
-        app.usecases.user.increment_replays_watched(db_score["userid"], mode),
-    )
+    app.usecases.user.increment_replays_watched(db_score["userid"], mode)
 
     logger.info(f"Served replay ID {score_id}")
     return Response(content=replay_bytes)
@@ -1,10 +1,11 @@
 from __future__ import annotations
 
 import asyncio
-import time
 from base64 import b64decode
 from copy import copy
 from datetime import datetime
+from typing import Any
+from typing import Awaitable
 from typing import NamedTuple
 from typing import Optional
 from typing import TypeVar
@@ -20,8 +21,10 @@ from app.constants.mods import Mods
 from app.constants.privileges import Privileges
 from app.constants.ranked_status import RankedStatus
 from app.constants.score_status import ScoreStatus
+from app.models.beatmap import Beatmap
 from app.models.score import Score
 from app.objects.path import Path
+from app.objects.stages import StageTimer
 from app.usecases.user import restrict_user
 from fastapi import File
 from fastapi import Form
@@ -91,6 +94,69 @@ def chart_entry(name: str, before: Optional[T], after: T) -> str:
     return f"{name}Before:{before or ''}|{name}After:{after}"
 
 
+async def noop() -> None:
+    return None
+
+
+async def calculate_performance(score: Score, beatmap: Beatmap) -> bool:
+    """Calculates the performance of a score if the beatmap's file is
+    available, returning whether it was."""
+
+    osu_file_path = MAPS_PATH / f"{beatmap.id}.osu"
+    if not await app.usecases.performance.check_local_file(
+        osu_file_path,
+        beatmap.id,
+        beatmap.md5,
+    ):
+        return False
+
+    await app.usecases.performance.calculate_score(score, beatmap.id)
+    return True
+
+
+async def is_duplicate_score(score: Score, beatmap: Beatmap) -> bool:
+    return bool(
+        await app.state.services.database.fetch_val(
+            (
+                f"SELECT 1 FROM {score.mode.scores_table} WHERE userid = :id AND beatmap_md5 = :md5 AND score = :score "
+                "AND play_mode = :mode AND mods = :mods"
+            ),
+            {
+                "id": score.user_id,
+                "md5": beatmap.md5,
+                "score": score.score,
+                "mode": score.mode.as_vn,
+                "mods": score.mods.value,
+            },
+        ),
+    )
+
+
+async def fetch_pp_cap(score: Score) -> int:
+    return await app.usecases.pp_cap.get_pp_cap(
+        score.mode,
+        score.mods & Mods.FLASHLIGHT != 0,
+    )
+
+
+async def insert_score(score: Score, beatmap: Beatmap) -> int:
+    if score.status == ScoreStatus.BEST:
+        await app.state.services.database.execute(
+            f"UPDATE {score.mode.scores_table} SET completed = 2 WHERE completed = 3 AND beatmap_md5 = :md5 AND userid = :id AND play_mode = :mode",
+            {"md5": beatmap.md5, "id": score.user_id, "mode": score.mode.as_vn},
+        )
+
+    return await app.state.services.database.execute(
+        (
+            f"INSERT INTO {score.mode.scores_table} (beatmap_md5, userid, score, max_combo, full_combo, mods, 300_count, 100_count, 50_count, katus_count, "
+            "gekis_count, misses_count, time, play_mode, completed, accuracy, pp, playtime) VALUES "
+            "(:beatmap_md5, :userid, :score, :max_combo, :full_combo, :mods, :300_count, :100_count, :50_count, :katus_count, "
+            ":gekis_count, :misses_count, :time, :play_mode, :completed, :accuracy, :pp, :playtime)"
+        ),
+        score.db_dict,
+    )
+
+
 async def submit_score(
     request: Request,
     token: Optional[str] = Header(None),
@@ -108,7 +174,8 @@ async def submit_score(
     client_hash_b64: bytes = Form(..., alias="s"),
     fl_cheat_screenshot: Optional[bytes] = File(None, alias="i"),
 ):
-    start = time.perf_counter_ns()
+
+    stages = StageTimer()
 
     score_params = await parse_form(await request.form())
     if not score_params:
@@ -123,11 +190,21 @@ async def submit_score(
     )
 
     username = score_data[1].rstrip()
-    if not (user := await app.usecases.user.auth_user(username, password_md5)):
+    beatmap_md5 = score_data[0]
+    # authenticated first, so garbage submissions can't spend osu!api requests
+    # on beatmap lookups.
+    user = await stages.run(
+        "auth",
+        app.usecases.user.auth_user(username, password_md5),
+    )
+    if not user:
         return  # empty resp tells osu to retry
 
-    beatmap_md5 = score_data[0]
-    if not (beatmap := await app.usecases.beatmap.fetch_by_md5(beatmap_md5)):
+    beatmap = await stages.run(
+        "beatmap",
+        app.usecases.beatmap.fetch_by_md5(beatmap_md5),
+    )
+    if not beatmap:
         return b"error: beatmap"
 
     # Prohibit bot users from submitting scores.
@@ -135,12 +212,11 @@ async def submit_score(
         return b"error: no"
 
     score = Score.from_submission(score_data[2:], beatmap_md5, user)
-    leaderboard = await app.usecases.leaderboards.fetch(beatmap, score.mode)
 
     score.acc = app.usecases.score.calculate_accuracy(score)
     score.quit = exited_out
 
-    await app.usecases.user.update_latest_activity(user.id)
+    app.usecases.journal.record_latest_activity(user.id)
 
     if not score.mods.rankable:
         return b"error: no"
@@ -172,22 +248,24 @@ async def submit_score(
             "(score submit gate)",
         )
 
-    osu_file_path = MAPS_PATH / f"{beatmap.id}.osu"
-    if await app.usecases.performance.check_local_file(
-        osu_file_path,
-        beatmap.id,
-        beatmap.md5,
-    ):
-        await app.usecases.performance.calculate_score(score, beatmap.id)
+    # The pp cap is only relevant to passes on maps giving pp.
+    check_pp_cap = beatmap.gives_pp and score.passed
+
+    leaderboard, has_local_file, is_duplicate, pp_cap = await stages.gather(
+        leaderboard=app.usecases.leaderboards.fetch(beatmap, score.mode),
+        performance=calculate_performance(score, beatmap),
+        duplicate_check=is_duplicate_score(score, beatmap),
+        pp_cap=fetch_pp_cap(score) if check_pp_cap else noop(),
+    )
 
+    if has_local_file:
         if score.passed:
             old_best = await leaderboard.find_user_score(user.id)
 
             if old_best:
-                score.old_best = old_best["score"]
-
-                if score.old_best:
-                    score.old_best.rank = old_best["rank"]
+                # copied, as it is the cached leaderboard's own score.
+                score.old_best = copy(old_best["score"])
+                score.old_best.rank = old_best["rank"]
 
             app.usecases.score.calculate_status(score)
         elif score.quit:
@@ -197,45 +275,10 @@ async def submit_score(
 
     score.time_elapsed = score_time if score.passed else fail_time
 
-    if await app.state.services.database.fetch_val(
-        (
-            f"SELECT 1 FROM {score.mode.scores_table} WHERE userid = :id AND beatmap_md5 = :md5 AND score = :score "
-            "AND play_mode = :mode AND mods = :mods"
-        ),
-        {
-            "id": user.id,
-            "md5": beatmap.md5,
-            "score": score.score,
-            "mode": score.mode.as_vn,
-            "mods": score.mods.value,
-        },
-    ):
-        # duplicate score detected
+    if is_duplicate:
         return b"error: no"
 
-    # update most played
-    await app.state.services.database.execute(
-        """\
-        INSERT INTO users_beatmap_playcount (user_id, beatmap_id, game_mode, playcount)
-        VALUES (:user_id, :beatmap_id, :game_mode, 1)
-        ON DUPLICATE KEY UPDATE playcount = playcount + 1
-        """,
-        {
-            "user_id": user.id,
-            "beatmap_id": beatmap.id,
-            "game_mode": score.mode.as_vn,
-        },
-    )
-
-    if (
-        beatmap.gives_pp
-        and score.passed
-        and score.pp
-        > await app.usecases.pp_cap.get_pp_cap(
-            score.mode,
-            score.mods & Mods.FLASHLIGHT != 0,
-        )
-    ):
+    if check_pp_cap and score.pp > pp_cap:
         # Separated from the previous clause to only call the pp cap function
         # when necessary.
         if not await app.usecases.verified.get_verified(
@@ -249,20 +292,11 @@ async def submit_score(
                 f" ID: {score.id} (score submit gate)",
             )
 
-    if score.status == ScoreStatus.BEST:
-        await app.state.services.database.execute(
-            f"UPDATE {score.mode.scores_table} SET completed = 2 WHERE completed = 3 AND beatmap_md5 = :md5 AND userid = :id AND play_mode = :mode",
-            {"md5": beatmap.md5, "id": user.id, "mode": score.mode.as_vn},
-        )
+    app.usecases.journal.record_user_playcount(score, beatmap)
 
-    score.id = await app.state.services.database.execute(
-        (
-            f"INSERT INTO {score.mode.scores_table} (beatmap_md5, userid, score, max_combo, full_combo, mods, 300_count, 100_count, 50_count, katus_count, "
-            "gekis_count, misses_count, time, play_mode, completed, accuracy, pp, playtime) VALUES "
-            "(:beatmap_md5, :userid, :score, :max_combo, :full_combo, :mods, :300_count, :100_count, :50_count, :katus_count, "
-            ":gekis_count, :misses_count, :time, :play_mode, :completed, :accuracy, :pp, :playtime)"
-        ),
-        score.db_dict,
+    score.id, stats = await stages.gather(
+        insert=insert_score(score, beatmap),
+        stats=app.usecases.stats.fetch(user.id, score.mode),
     )
 
     if score.passed:
@@ -277,15 +311,17 @@ async def submit_score(
                 "a replay editor. (score submit gate)",
             )
         else:
-            await app.state.services.replay_storage.save(
-                f"replay_{score.id}.osr",
-                replay_data,
+            await stages.run(
+                "replay",
+                app.state.services.replay_storage.save(
+                    f"replay_{score.id}.osr",
+                    replay_data,
+                ),
             )
 
-    asyncio.create_task(app.usecases.beatmap.increment_playcount(beatmap))
-    asyncio.create_task(app.usecases.user.increment_playtime(score, beatmap))
+    app.usecases.journal.record_beatmap_playcount(beatmap)
+    app.usecases.journal.record_playtime(score, beatmap)
 
-    stats = await app.usecases.stats.fetch(user.id, score.mode)
     assert stats is not None
 
     old_stats = copy(stats)
@@ -294,6 +330,8 @@ async def submit_score(
     stats.total_score += score.score
     stats.total_hits += score.n300 + score.n100 + score.n50
 
+    stats_stages: dict[str, Awaitable[Any]] = {}
+
     if score.passed and beatmap.has_leaderboard:
         if beatmap.status == RankedStatus.RANKED:
             stats.ranked_score += score.score
@@ -305,20 +343,44 @@ async def submit_score(
             stats.max_combo = score.max_combo
 
         if score.status == ScoreStatus.BEST and score.pp:
-            await app.usecases.stats.full_recalc(stats)
+            stats_stages["recalc"] = app.usecases.stats.recalc_with_best(
+                stats,
+                score,
+                beatmap,
+            )
+        elif score.status == ScoreStatus.BEST:
+            # the cached top scores would otherwise miss this score.
+            app.usecases.stats.invalidate_top_scores(user.id, score.mode)
+
+        # the other workers' cached top scores would miss it too.
+        if score.status == ScoreStatus.BEST:
+            stats_stages["top_scores_change"] = (
+                app.usecases.stats.publish_top_scores_change(user.id, score.mode)
+            )
+
+    # every new best belongs on the leaderboard, whatever its pp or the
+    # beatmap's status.
+    if score.status == ScoreStatus.BEST:
+        stats_stages["leaderboard_update"] = app.usecases.leaderboards.add_score(
+            beatmap,
+            leaderboard,
+            score,
+            user.country,
+        )
 
-            await leaderboard.add_score(score)
+    if stats_stages:
+        await stages.gather(**stats_stages)
 
-    await app.usecases.stats.save(stats)
+    await stages.run("stats_save", app.usecases.stats.save(stats))
 
     if (
         score.status == ScoreStatus.BEST
         and not user.privileges.is_restricted
         and old_stats.pp != stats.pp
     ):
-        await app.usecases.stats.update_rank(stats)
+        await stages.run("update_rank", app.usecases.stats.update_rank(stats))
 
-    await app.usecases.stats.refresh_stats(user.id)
+    await stages.run("refresh_stats", app.usecases.stats.refresh_stats(user.id))
 
     if score.status == ScoreStatus.BEST:
         score.rank = await leaderboard.find_score_rank(score.user_id, score.id)
@@ -400,10 +462,10 @@ async def submit_score(
         f"achievements-new:{achievements_str}",
     ]
 
-    end = time.perf_counter_ns()
-    formatted_time = app.utils.format_time(end - start)
+    formatted_time = app.utils.format_time(stages.elapsed)
     logger.info(
         f"{user} submitted a {score.pp:.2f}pp {score.mode!r} score on {beatmap.song_name} in {formatted_time}",
     )
+    logger.debug(f"Score submission stages ({score.id}): {stages.format()}")
 
     return "|".join(submission_charts).encode()
@@ -40,8 +40,54 @@ def init_events(asgi_app: FastAPI) -> None:
         )
 
         await app.state.cache.init_cache()
+        await app.usecases.privileges.init_restricted_users()
         await app.redis.initialise_pubsubs()
 
+        if settings.LEADERBOARD_PRELOAD_COUNT:
+            preload_task = asyncio.create_task(
+                app.usecases.leaderboards.preload(
+                    settings.LEADERBOARD_PRELOAD_COUNT,
+                    settings.LEADERBOARD_PRELOAD_CONCURRENCY,
+                ),
+            )
+            app.state.tasks.add(preload_task)
+        else:
+            app.usecases.leaderboards.PRELOADED = True
+
+        await asyncio.to_thread(app.usecases.performance.FILE_INDEX.load)
+        file_index_task = asyncio.create_task(
+            app.usecases.performance.save_file_index_loop(
+                settings.BEATMAP_FILE_INDEX_SAVE_INTERVAL,
+            ),
+        )
+        app.state.tasks.add(file_index_task)
+
+        if settings.BEATMAP_FILE_MAX_IDLE:
+            prune_task = asyncio.create_task(
+                app.usecases.performance.prune_files_loop(
+                    settings.BEATMAP_FILE_PRUNE_INTERVAL,
+                    settings.BEATMAP_FILE_MAX_IDLE,
+                ),
+            )
+            app.state.tasks.add(prune_task)
+
+        journal_task = asyncio.create_task(
+            app.usecases.journal.flush_loop(settings.JOURNAL_FLUSH_INTERVAL),
+        )
+        app.state.tasks.add(journal_task)
+
+        counters_task = asyncio.create_task(
+            app.usecases.counters.flush_loop(settings.COUNTERS_FLUSH_INTERVAL),
+        )
+        app.state.tasks.add(counters_task)
+
+        refresh_task = asyncio.create_task(
+            app.usecases.beatmap.REFRESH_QUEUE.run(
+                settings.BEATMAP_REFRESH_CONCURRENCY,
+            ),
+        )
+        app.state.tasks.add(refresh_task)
+
         logger.info("Server has started!")
 
     @asgi_app.on_event("shutdown")
@@ -2,6 +2,8 @@ from __future__ import annotations
 
 import time
 from dataclasses import dataclass
+from typing import Any
+from typing import Mapping
 from typing import Optional
 
 from app.constants.mode import Mode
@@ -43,27 +45,7 @@ class Score:
     time_elapsed: int
 
     rank: int = 0
-    old_best: Optional[Score] = None
-
-    def osu_string(
-        self,
-        username: str,
-        rank: int,
-        show_pp: Optional[bool] = None,
-    ) -> str:
-        score = self.score
-
-        if show_pp:
-            score = int(self.pp)
-        elif show_pp is None:
-            if self.mode > Mode.MANIA:
-                score = int(self.pp)
-
-        return (
-            f"{self.id}|{username}|{score}|{self.max_combo}|{self.n50}|{self.n100}|{self.n300}|{self.nmiss}|"
-            f"{self.nkatu}|{self.ngeki}|{int(self.full_combo)}|{int(self.mods)}|{self.user_id}|{rank}|{self.time}|"
-            "1"  # has replay
-        )
+    old_best: Optional[LeaderboardScore] = None
 
     @property
     def db_dict(self) -> dict:
@@ -141,3 +123,213 @@ class Score:
             time=int(time.time()),
             time_elapsed=0,  # set later
         )
+
+
+class LeaderboardScore:
+    """A compact, slotted representation of a score held within (cached)
+    leaderboards. Holds only what is required to rank and display the score,
+    converting to enums only when accessed."""
+
+    __slots__ = (
+        "id",
+        "user_id",
+        "score",
+        "pp",
+        "acc",
+        "max_combo",
+        "full_combo",
+        "n300",
+        "n100",
+        "n50",
+        "nmiss",
+        "ngeki",
+        "nkatu",
+        "time",
+        "_mods",
+        "_play_mode",
+        "_status",
+        "country",
+        "rank",
+    )
+
+    # The score columns required to construct it, in the order of `payload`.
+    # `from_row` additionally expects the owner's `country`.
+    COLUMNS = (
+        "id",
+        "userid",
+        "score",
+        "pp",
+        "accuracy",
+        "max_combo",
+        "full_combo",
+        "300_count",
+        "100_count",
+        "50_count",
+        "misses_count",
+        "gekis_count",
+        "katus_count",
+        "time",
+        "mods",
+        "play_mode",
+        "completed",
+    )
+
+    def __init__(
+        self,
+        id: int,
+        user_id: int,
+        score: int,
+        pp: float,
+        acc: float,
+        max_combo: int,
+        full_combo: bool,
+        n300: int,
+        n100: int,
+        n50: int,
+        nmiss: int,
+        ngeki: int,
+        nkatu: int,
+        time: int,
+        mods: int,
+        play_mode: int,
+        status: int,
+        country: str,
+    ) -> None:
+        self.id = id
+        self.user_id = user_id
+        self.score = score
+        self.pp = pp
+        self.acc = acc
+        self.max_combo = max_combo
+        self.full_combo = full_combo
+        self.n300 = n300
+        self.n100 = n100
+        self.n50 = n50
+        self.nmiss = nmiss
+        self.ngeki = ngeki
+        self.nkatu = nkatu
+        self.time = time
+        self._mods = mods
+        self._play_mode = play_mode
+        self._status = status
+        self.country = country
+        self.rank = 0
+
+    def __repr__(self) -> str:
+        return f"<LeaderboardScore {self.id} by {self.user_id}>"
+
+    @property
+    def mods(self) -> Mods:
+        return Mods(self._mods)
+
+    @property
+    def mods_value(self) -> int:
+        return self._mods
+
+    @property
+    def mode(self) -> Mode:
+        return Mode.from_lb(self._play_mode, self._mods)
+
+    @property
+    def status(self) -> ScoreStatus:
+        return ScoreStatus(self._status)
+
+    @status.setter
+    def status(self, status: ScoreStatus) -> None:
+        self._status = status.value
+
+    def osu_string(
+        self,
+        username: str,
+        rank: int,
+        show_pp: Optional[bool] = None,
+    ) -> str:
+        score = self.score
+
+        if show_pp:
+            score = int(self.pp)
+        elif show_pp is None:
+            if self.mode > Mode.MANIA:
+                score = int(self.pp)
+
+        return (
+            f"{self.id}|{username}|{score}|{self.max_combo}|{self.n50}|{self.n100}|{self.n300}|{self.nmiss}|"
+            f"{self.nkatu}|{self.ngeki}|{int(self.full_combo)}|{self._mods}|{self.user_id}|{rank}|{self.time}|"
+            "1"  # has replay
+        )
+
+    @property
+    def payload(self) -> list[Any]:
+        """The score's values as a list, in the order of `COLUMNS` followed by
+        the country."""
+
+        return [
+            self.id,
+            self.user_id,
+            self.score,
+            self.pp,
+            self.acc,
+            self.max_combo,
+            self.full_combo,
+            self.n300,
+            self.n100,
+            self.n50,
+            self.nmiss,
+            self.ngeki,
+            self.nkatu,
+            self.time,
+            self._mods,
+            self._play_mode,
+            self._status,
+            self.country,
+        ]
+
+    @classmethod
+    def from_payload(cls, payload: list[Any]) -> LeaderboardScore:
+        return cls(*payload)
+
+    @classmethod
+    def from_row(cls, row: Mapping[str, Any]) -> LeaderboardScore:
+        return cls(
+            id=row["id"],
+            user_id=row["userid"],
+            score=row["score"],
+            pp=row["pp"],
+            acc=row["accuracy"],
+            max_combo=row["max_combo"],
+            full_combo=bool(row["full_combo"]),
+            n300=row["300_count"],
+            n100=row["100_count"],
+            n50=row["50_count"],
+            nmiss=row["misses_count"],
+            ngeki=row["gekis_count"],
+            nkatu=row["katus_count"],
+            time=int(row["time"]),
+            mods=row["mods"],
+            play_mode=row["play_mode"],
+            status=row["completed"],
+            country=row["country"] or "XX",
+        )
+
+    @classmethod
+    def from_score(cls, score: Score, country: str) -> LeaderboardScore:
+        return cls(
+            id=score.id,
+            user_id=score.user_id,
+            score=score.score,
+            pp=score.pp,
+            acc=score.acc,
+            max_combo=score.max_combo,
+            full_combo=score.full_combo,
+            n300=score.n300,
+            n100=score.n100,
+            n50=score.n50,
+            nmiss=score.nmiss,
+            ngeki=score.ngeki,
+            nkatu=score.nkatu,
+            time=score.time,
+            mods=score.mods.value,
+            play_mode=score.mode.as_vn,
+            status=score.status.value,
+            country=country,
+        )
@@ -11,7 +11,7 @@ class User:
     id: int
     name: str
     privileges: Privileges
-    friends: list[int]
+    friends: frozenset[int]
     password_bcrypt: str
     country: str
     coins: int
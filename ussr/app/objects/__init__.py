@@ -1,6 +1,20 @@
 from __future__ import annotations
 
+from . import batcher
+from . import beatmap_cache
 from . import binary
+from . import circuit_breaker
+from . import counters
+from . import file_index
+from . import file_store
+from . import histogram
+from . import journal
 from . import leaderboard
+from . import lru
 from . import oppai
 from . import path
+from . import refresh_queue
+from . import single_flight
+from . import stages
+from . import token_bucket
+from . import top_scores
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Awaitable
+from typing import Callable
+from typing import Generic
+from typing import Optional
+from typing import TypeVar
+
+import app.utils
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class Batcher(Generic[T, R]):
+    """Collects concurrent calls into batches, handled by a single call to
+    `handler` once `max_size` calls were collected or `window` seconds
+    passed since the first.
+
+    Note:
+        At most `max_pending` calls may be collected or in flight at once,
+        with further calls waiting for one to finish.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[list[T]], Awaitable[list[R]]],
+        max_size: int,
+        window: float,
+        max_pending: int,
+    ) -> None:
+        self._handler = handler
+        self.max_size = max_size
+        self.window = window
+        self.max_pending = max_pending
+
+        self._batch: list[tuple[T, asyncio.Future[R]]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # created lazily, as it has to be created within the running loop.
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    def __len__(self) -> int:
+        return len(self._batch)
+
+    async def submit(self, item: T) -> R:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+
+        async with self._slots:
+            future: asyncio.Future[R] = asyncio.get_running_loop().create_future()
+            self._batch.append((item, future))
+
+            if len(self._batch) >= self.max_size:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = asyncio.get_running_loop().call_later(
+                    self.window,
+                    self._flush,
+                )
+
+            return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch, self._batch = self._batch, []
+        if not batch:
+            return
+
+        task = app.utils.create_isolated_task(self._handle(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _handle(self, batch: list[tuple[T, asyncio.Future[R]]]) -> None:
+        try:
+            results = await self._handler([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(
+                    f"Expected {len(batch)} results, but got {len(results)}.",
+                )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+            return
+
+        # callers which timed out have already cancelled theirs.
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
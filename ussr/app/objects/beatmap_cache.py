@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+from typing import Optional
+
+from app.models.beatmap import Beatmap
+from app.objects.lru import CacheStats
+from app.objects.lru import LRUCache
+
+
+class BeatmapCache:
+    """A size-bounded cache of beatmaps, looked up by md5, id or set id.
+
+    Note:
+        Entries are stored by md5, with the id and set indexes kept in sync
+        as entries are added, evicted or expire. Beatmaps without a
+        leaderboard expire after `unranked_ttl`, as they may still change.
+
+        A set is only returned once it has been cached as a whole through
+        `add_set`, and stops being returned once any of its beatmaps leave.
+    """
+
+    def __init__(self, max_size: int, unranked_ttl: float) -> None:
+        self._beatmaps: LRUCache[str, Beatmap] = LRUCache(
+            max_size=max_size,
+            on_remove=self._on_remove,
+        )
+        self.unranked_ttl = unranked_ttl
+
+        self._ids: dict[int, str] = {}
+        # ordered dicts used as sets, to keep the order beatmaps were added in.
+        self._sets: dict[int, dict[str, None]] = {}
+        self._complete_sets: set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._beatmaps)
+
+    def _on_remove(self, md5: str, beatmap: Beatmap) -> None:
+        if self._ids.get(beatmap.id) == md5:
+            del self._ids[beatmap.id]
+
+        if (set_md5s := self._sets.get(beatmap.set_id)) is not None:
+            set_md5s.pop(md5, None)
+            if not set_md5s:
+                del self._sets[beatmap.set_id]
+
+        self._complete_sets.discard(beatmap.set_id)
+
+    def get_by_md5(self, md5: str) -> Optional[Beatmap]:
+        return self._beatmaps.get(md5)
+
+    def get_by_id(self, id: int) -> Optional[Beatmap]:
+        md5 = self._ids.get(id)
+        if md5 is None:
+            self._beatmaps.misses += 1
+            return None
+
+        return self._beatmaps.get(md5)
+
+    def get_set(self, set_id: int) -> Optional[list[Beatmap]]:
+        if set_id not in self._complete_sets:
+            self._beatmaps.misses += 1
+            return None
+
+        beatmaps: list[Beatmap] = []
+        for md5 in list(self._sets[set_id]):
+            beatmap = self._beatmaps.get(md5)
+            if beatmap is None:
+                return None  # expired, which also marked the set incomplete.
+
+            beatmaps.append(beatmap)
+
+        return beatmaps
+
+    def add(self, beatmap: Beatmap) -> None:
+        # a previous version of the beatmap, which is now outdated. The set
+        # remains complete, as this version replaces it.
+        old_md5 = self._ids.get(beatmap.id)
+        if old_md5 is not None and old_md5 != beatmap.md5:
+            set_complete = beatmap.set_id in self._complete_sets
+            self._beatmaps.pop(old_md5)
+
+            if set_complete:
+                self._complete_sets.add(beatmap.set_id)
+
+        ttl = 0 if beatmap.has_leaderboard else self.unranked_ttl
+        self._beatmaps.set(beatmap.md5, beatmap, ttl=ttl)
+
+        self._ids[beatmap.id] = beatmap.md5
+        self._sets.setdefault(beatmap.set_id, {})[beatmap.md5] = None
+
+    def add_set(self, set_id: int, beatmaps: list[Beatmap]) -> None:
+        # drop beatmaps which are no longer part of the set.
+        md5s = {beatmap.md5 for beatmap in beatmaps}
+        for md5 in list(self._sets.get(set_id, ())):
+            if md5 not in md5s:
+                self._beatmaps.pop(md5)
+
+        for beatmap in beatmaps:
+            self.add(beatmap)
+
+        # only if none of them were evicted while adding the rest.
+        if all(beatmap.md5 in self._beatmaps for beatmap in beatmaps):
+            self._complete_sets.add(set_id)
+
+    def remove(self, md5: str) -> Optional[Beatmap]:
+        return self._beatmaps.pop(md5)
+
+    def remove_set(self, set_id: int) -> None:
+        for md5 in list(self._sets.get(set_id, ())):
+            self._beatmaps.pop(md5)
+
+        self._complete_sets.discard(set_id)
+
+    @property
+    def stats(self) -> CacheStats:
+        return self._beatmaps.stats
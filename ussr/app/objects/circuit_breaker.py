@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import time
+from enum import Enum
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Stops calls to a failing service for a while, so callers fail fast
+    rather than each waiting on it.
+
+    Note:
+        After `failure_threshold` consecutive failures the circuit opens for
+        `cooldown` seconds, after which a single trial call is allowed.
+        That call succeeding closes the circuit again, while it failing
+        re-opens it.
+    """
+
+    __slots__ = (
+        "failure_threshold",
+        "cooldown",
+        "failures",
+        "_opened_at",
+        "_trial_in_progress",
+    )
+
+    def __init__(self, failure_threshold: int, cooldown: float) -> None:
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial_in_progress = False
+
+    @property
+    def state(self) -> CircuitState:
+        if self.failures < self.failure_threshold:
+            return CircuitState.CLOSED
+
+        if time.monotonic() - self._opened_at < self.cooldown:
+            return CircuitState.OPEN
+
+        return CircuitState.HALF_OPEN
+
+    def allow(self) -> bool:
+        state = self.state
+        if state is CircuitState.CLOSED:
+            return True
+
+        if state is CircuitState.HALF_OPEN and not self._trial_in_progress:
+            self._trial_in_progress = True
+            return True
+
+        return False
+
+    def release(self) -> None:
+        """Gives up a call allowed by `allow` without making it, letting
+        another trial call through."""
+
+        self._trial_in_progress = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._trial_in_progress = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_in_progress = False
+
+        if self.failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+from collections import Counter
+from collections import defaultdict
+from typing import Any
+from typing import NamedTuple
+
+import app.state.services
+
+# Max amount of rows affected by a single statement.
+FLUSH_CHUNK_SIZE = 500
+
+
+class CounterColumn(NamedTuple):
+    table: str
+    key_column: str
+    column: str
+
+
+class Counters:
+    """Accumulates increments to integer columns, writing them as batched
+    `column = column + delta` updates.
+
+    Note:
+        Rows sharing the same delta are updated by a single statement, so
+        flushing many rows usually only takes a handful of statements.
+    """
+
+    def __init__(self) -> None:
+        self._deltas: defaultdict[CounterColumn, Counter[Any]] = defaultdict(Counter)
+
+    def __len__(self) -> int:
+        return sum(len(deltas) for deltas in self._deltas.values())
+
+    def add(
+        self,
+        table: str,
+        key_column: str,
+        column: str,
+        key: Any,
+        delta: int = 1,
+    ) -> None:
+        self._deltas[CounterColumn(table, key_column, column)][key] += delta
+
+    async def flush(self) -> int:
+        """Writes all accumulated deltas to the database, returning the amount
+        of rows updated. Deltas which could not be written are kept."""
+
+        deltas, self._deltas = self._deltas, defaultdict(Counter)
+
+        updated = 0
+        try:
+            for counter_column, column_deltas in deltas.items():
+                updated += await _flush_column(counter_column, column_deltas)
+        finally:
+            for counter_column, column_deltas in deltas.items():
+                if column_deltas:
+                    self._deltas[counter_column].update(column_deltas)
+
+        return updated
+
+
+async def _flush_column(counter_column: CounterColumn, deltas: Counter[Any]) -> int:
+    """Writes the deltas of a single column, removing them from `deltas` as
+    they are written."""
+
+    keys_by_delta: defaultdict[int, list[Any]] = defaultdict(list)
+    for key, delta in deltas.items():
+        if delta:
+            keys_by_delta[delta].append(key)
+
+    table, key_column, column = counter_column
+
+    updated = 0
+    for delta, keys in keys_by_delta.items():
+        for idx in range(0, len(keys), FLUSH_CHUNK_SIZE):
+            chunk = keys[idx : idx + FLUSH_CHUNK_SIZE]
+            params = {f"key_{key_idx}": key for key_idx, key in enumerate(chunk)}
+
+            await app.state.services.database.execute(
+                f"UPDATE {table} SET {column} = {column} + :delta "
+                f"WHERE {key_column} IN ({', '.join(f':{param}' for param in params)})",
+                {"delta": delta, **params},
+            )
+
+            for key in chunk:
+                del deltas[key]
+
+            updated += len(chunk)
+
+    deltas.clear()  # only zero deltas are left.
+    return updated
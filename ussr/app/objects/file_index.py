@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import fcntl
+import os
+from typing import Any
+from typing import NamedTuple
+from typing import Optional
+
+import logger
+import orjson
+
+
+class IndexEntry(NamedTuple):
+    size: int
+    mtime_ns: int
+    md5: str
+
+
+class FileIndex:
+    """The md5s of beatmap files, by beatmap id, along with the size and
+    modification time they were hashed at, persisted to a JSON file.
+
+    Note:
+        An entry is only returned while the file's size and modification
+        time are unchanged, so a file is only hashed again once modified.
+
+        Every worker shares the file, merging the entries it changed into
+        it under a lock. Entries saved by other workers are only seen once
+        the index is loaded again.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._entries: dict[int, IndexEntry] = {}
+        self._changed: set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._changed)
+
+    def get(self, beatmap_id: int, size: int, mtime_ns: int) -> Optional[str]:
+        entry = self._entries.get(beatmap_id)
+        if entry is None or entry.size != size or entry.mtime_ns != mtime_ns:
+            return None
+
+        return entry.md5
+
+    def set(self, beatmap_id: int, size: int, mtime_ns: int, md5: str) -> None:
+        self._entries[beatmap_id] = IndexEntry(size, mtime_ns, md5)
+        self._changed.add(beatmap_id)
+
+    def _read(self) -> dict[str, Any]:
+        try:
+            with open(self.path, "rb") as f:
+                return orjson.loads(f.read())
+        except FileNotFoundError:
+            return {}
+        except orjson.JSONDecodeError:
+            logger.warning(f"Ignoring malformed file index {self.path}.")
+            return {}
+
+    def load(self) -> None:
+        self._entries = {
+            int(beatmap_id): IndexEntry(*entry)
+            for beatmap_id, entry in self._read().items()
+        }
+
+    def take_changes(self) -> dict[str, list[Any]]:
+        """Returns the entries changed since the last call, clearing `dirty`.
+        Taken on the event loop, so that `write` may run in a thread."""
+
+        changes = {
+            str(beatmap_id): list(self._entries[beatmap_id])
+            for beatmap_id in self._changed
+        }
+        self._changed = set()
+        return changes
+
+    def write(self, changes: dict[str, list[Any]]) -> None:
+        """Merges entries returned by `take_changes` into the file, keeping
+        the ones saved by other workers."""
+
+        with open(f"{self.path}.lock", "wb") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            db_entries = self._read()
+            db_entries.update(changes)
+
+            # written to a temporary file first, so a crash never leaves a
+            # torn one.
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(orjson.dumps(db_entries))
+
+            os.replace(temp_path, self.path)
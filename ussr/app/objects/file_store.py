@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import os
+import zlib
+from typing import Optional
+
+
+class FileStore:
+    """A compressed store of files addressed by their md5, sharded into
+    directories by the first two characters of it.
+
+    Note:
+        As files are addressed by their content, storing one which is
+        already stored is a no-op, and stored files never change.
+    """
+
+    def __init__(self, directory: str, compression_level: int = 6) -> None:
+        self.directory = directory
+        self.compression_level = compression_level
+
+    def path(self, md5: str) -> str:
+        return os.path.join(self.directory, md5[:2], f"{md5}.z")
+
+    def __contains__(self, md5: str) -> bool:
+        return os.path.exists(self.path(md5))
+
+    def get(self, md5: str) -> Optional[bytes]:
+        try:
+            with open(self.path(md5), "rb") as f:
+                return zlib.decompress(f.read())
+        except FileNotFoundError:
+            return None
+
+    def put(self, md5: str, contents: bytes) -> None:
+        path = self.path(md5)
+        if os.path.exists(path):
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # written to a temporary file first, so a crash never leaves a torn one.
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(zlib.compress(contents, self.compression_level))
+
+        os.replace(temp_path, path)
@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+from typing import TypedDict
+
+
+class HistogramStats(TypedDict):
+    count: int
+    sum: float
+    buckets: dict[str, int]
+
+
+class Histogram:
+    """A histogram of observations over fixed buckets, each counting the
+    observations less than or equal to its upper bound."""
+
+    __slots__ = ("bounds", "counts", "count", "sum")
+
+    def __init__(self, bounds: tuple[float, ...]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # the last is for +inf.
+
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    @property
+    def stats(self) -> HistogramStats:
+        buckets: dict[str, int] = {}
+
+        cumulative = 0
+        for bound, count in zip((*self.bounds, "+inf"), self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": buckets,
+        }
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import fcntl
+import glob
+import os
+import time
+from typing import Any
+from typing import BinaryIO
+from typing import Optional
+
+import logger
+import orjson
+
+
+class Journal:
+    """An append-only file of JSON entries, one per line, with each process
+    appending to its own.
+
+    Note:
+        Each process appends to a `{path}.{pid}.{time}` file, which it holds
+        an exclusive lock on from creation until its entries are completed.
+        `take` hands out the current file along with any unlocked files left
+        behind by processes which exited, locking them first. These are only
+        removed once `complete` is called, meaning entries are delivered at
+        least once, and by a single process.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+        self._file: Optional[BinaryIO] = None
+        self._file_path = ""
+        self._taken: list[tuple[str, BinaryIO]] = []
+
+    def _open(self) -> BinaryIO:
+        if self._file is None:
+            # the pid is read here rather than on creation, as workers may be
+            # forked after the module was imported.
+            self._file_path = f"{self.path}.{os.getpid()}.{time.time_ns()}"
+            self._file = open(self._file_path, "ab+")
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+
+        return self._file
+
+    def append(self, entry: dict[str, Any]) -> None:
+        journal_file = self._open()
+        journal_file.write(orjson.dumps(entry) + b"\n")
+        journal_file.flush()
+
+    def close(self) -> None:
+        """Closes every file, leaving entries which were not completed to be
+        taken again."""
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+        for _, taken_file in self._taken:
+            taken_file.close()
+
+        self._taken = []
+
+    def _claim_abandoned(self) -> None:
+        taken_paths = {path for path, _ in self._taken}
+
+        for path in (self.path, *glob.glob(f"{glob.escape(self.path)}.*")):
+            if path in taken_paths or path == self._file_path:
+                continue
+
+            try:
+                abandoned_file = open(path, "rb")
+            except FileNotFoundError:
+                continue
+
+            try:
+                fcntl.flock(abandoned_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+                # it may have been completed by another process before we
+                # acquired the lock.
+                if os.stat(path).st_ino != os.fstat(abandoned_file.fileno()).st_ino:
+                    raise FileNotFoundError
+            except (BlockingIOError, FileNotFoundError):
+                abandoned_file.close()
+                continue
+
+            self._taken.append((path, abandoned_file))
+
+    def take(self) -> list[dict[str, Any]]:
+        """Returns the entries of the current file and any abandoned ones.
+        These are kept on disk until `complete` is called, with later calls
+        returning them again until then."""
+
+        if not self._taken:
+            if self._file is not None:
+                os.fsync(self._file.fileno())
+                self._taken.append((self._file_path, self._file))
+
+                self._file = None
+                self._file_path = ""
+
+            self._claim_abandoned()
+
+        entries: list[dict[str, Any]] = []
+        for _, taken_file in self._taken:
+            taken_file.seek(0)
+
+            for line in taken_file.read().splitlines():
+                if not line:
+                    continue
+
+                try:
+                    entries.append(orjson.loads(line))
+                except orjson.JSONDecodeError:
+                    # a partial write from a crash, there is nothing to recover.
+                    logger.warning(f"Skipping malformed journal entry: {line!r}")
+
+        return entries
+
+    def complete(self) -> None:
+        """Discards the entries handed out by `take`."""
+
+        for path, taken_file in self._taken:
+            # removed while still locked, so no other process can claim it.
+            os.remove(path)
+            taken_file.close()
+
+        self._taken = []
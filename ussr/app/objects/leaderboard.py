@@ -1,114 +1,407 @@
 from __future__ import annotations
 
+from bisect import bisect_left
+from bisect import bisect_right
 from dataclasses import dataclass
 from dataclasses import field
+from typing import NamedTuple
 from typing import Optional
 from typing import TYPE_CHECKING
 from typing import TypedDict
 from typing import Union
 
+import app.usecases.privileges
 from app.constants.mode import Mode
 
 if TYPE_CHECKING:
-    from app.models.score import Score
+    from app.models.score import LeaderboardScore
 
 
 class UserScore(TypedDict):
-    score: Score
+    score: LeaderboardScore
     rank: int
 
 
+class RenderedScores(NamedTuple):
+    scores: list[LeaderboardScore]
+    lines: list[bytes]
+    positions: dict[int, int]
+
+
+class SortedScores:
+    """A list of scores kept in descending order of a sort key.
+
+    Note:
+        Keys are stored negated so the standard library `bisect` functions
+        (which assume ascending order) may be used on them directly. Scores
+        with equal keys are kept in insertion order.
+    """
+
+    __slots__ = ("scores", "_keys")
+
+    def __init__(self) -> None:
+        self.scores: list[LeaderboardScore] = []
+        self._keys: list[float] = []
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def insert(self, sort_value: Union[int, float], score: LeaderboardScore) -> int:
+        idx = bisect_right(self._keys, -sort_value)
+
+        self._keys.insert(idx, -sort_value)
+        self.scores.insert(idx, score)
+
+        return idx
+
+    def index(
+        self,
+        sort_value: Union[int, float],
+        score: LeaderboardScore,
+    ) -> Optional[int]:
+        lo = bisect_left(self._keys, -sort_value)
+        hi = bisect_right(self._keys, -sort_value, lo)
+
+        for idx in range(lo, hi):
+            if self.scores[idx] is score:
+                return idx
+
+        return None
+
+    def remove(
+        self,
+        sort_value: Union[int, float],
+        score: LeaderboardScore,
+    ) -> Optional[int]:
+        idx = self.index(sort_value, score)
+        if idx is not None:
+            self.pop(idx)
+
+        return idx
+
+    def pop(self, idx: int) -> LeaderboardScore:
+        self._keys.pop(idx)
+        return self.scores.pop(idx)
+
+    def count_greater(self, sort_value: Union[int, float]) -> int:
+        """Returns the amount of scores with a sort key greater than
+        `sort_value`."""
+
+        return bisect_left(self._keys, -sort_value)
+
+    def count_at_least(self, sort_value: Union[int, float]) -> int:
+        """Returns the amount of scores with a sort key greater than or equal
+        to `sort_value`."""
+
+        return bisect_right(self._keys, -sort_value)
+
+
+def _filter_unrestricted(
+    scores: list[LeaderboardScore],
+    user_id: int,
+    include_self: bool = True,
+    limit: Optional[int] = None,
+) -> list[LeaderboardScore]:
+    restricted_users = app.usecases.privileges.RESTRICTED_USERS
+    if not restricted_users:
+        return scores[:limit]
+
+    results: list[LeaderboardScore] = []
+    for score in scores:
+        if limit is not None and len(results) >= limit:
+            break
+
+        if score.user_id in restricted_users and not (
+            score.user_id == user_id and include_self
+        ):
+            continue
+
+        results.append(score)
+
+    return results
+
+
 @dataclass
 class Leaderboard:
     mode: Mode
-    scores: list[Score] = field(default_factory=list)
+    scores: list[LeaderboardScore] = field(default_factory=list)
+
+    _sorted: SortedScores = field(
+        default_factory=SortedScores,
+        init=False,
+        repr=False,
+    )
+    _user_scores: dict[int, LeaderboardScore] = field(
+        default_factory=dict,
+        init=False,
+        repr=False,
+    )
+
+    # Partitioned views of the leaderboard, in the same order.
+    _country_scores: dict[str, SortedScores] = field(
+        default_factory=dict,
+        init=False,
+        repr=False,
+    )
+    _mods_scores: dict[int, SortedScores] = field(
+        default_factory=dict,
+        init=False,
+        repr=False,
+    )
+
+    # The scores of restricted users, in the same order, which are rebuilt
+    # whenever the restricted users change.
+    _hidden: SortedScores = field(
+        default_factory=SortedScores,
+        init=False,
+        repr=False,
+    )
+    _hidden_version: int = field(default=-1, init=False, repr=False)
+
+    # Pre-rendered score rows shared between viewers. This is replaced rather
+    # than cleared on changes, so renders racing a change are discarded.
+    rendered: dict[tuple[bool, int, Optional[bool]], RenderedScores] = field(
+        default_factory=dict,
+        init=False,
+        repr=False,
+    )
+
+    def __post_init__(self) -> None:
+        self.sort()
 
     def __len__(self) -> int:
         return len(self.scores)
 
+    def sort_value(self, score: LeaderboardScore) -> Union[int, float]:
+        if self.mode > Mode.MANIA:
+            return score.pp
+
+        return score.score
+
+    def _insert(self, score: LeaderboardScore) -> None:
+        sort_value = self.sort_value(score)
+
+        self._sorted.insert(sort_value, score)
+        self._user_scores[score.user_id] = score
+
+        if (country_scores := self._country_scores.get(score.country)) is None:
+            country_scores = self._country_scores[score.country] = SortedScores()
+        country_scores.insert(sort_value, score)
+
+        if (mods_scores := self._mods_scores.get(score.mods_value)) is None:
+            mods_scores = self._mods_scores[score.mods_value] = SortedScores()
+        mods_scores.insert(sort_value, score)
+
+        if (
+            self._hidden_version == app.usecases.privileges.RESTRICTED_USERS_VERSION
+            and score.user_id in app.usecases.privileges.RESTRICTED_USERS
+        ):
+            self._hidden.insert(sort_value, score)
+
+    def _remove_from_partitions(self, score: LeaderboardScore) -> None:
+        sort_value = self.sort_value(score)
+
+        if country_scores := self._country_scores.get(score.country):
+            country_scores.remove(sort_value, score)
+
+            if not country_scores:
+                del self._country_scores[score.country]
+
+        if mods_scores := self._mods_scores.get(score.mods_value):
+            mods_scores.remove(sort_value, score)
+
+            if not mods_scores:
+                del self._mods_scores[score.mods_value]
+
+        if self._hidden_version == app.usecases.privileges.RESTRICTED_USERS_VERSION:
+            self._hidden.remove(sort_value, score)
+
     def remove_score_index(self, index: int) -> None:
-        self.scores.pop(index)
+        self.rendered = {}
+        score = self._sorted.pop(index)
+
+        if self._user_scores.get(score.user_id) is score:
+            del self._user_scores[score.user_id]
+
+        self._remove_from_partitions(score)
+
+    def _hidden_scores(self) -> SortedScores:
+        version = app.usecases.privileges.RESTRICTED_USERS_VERSION
+        if self._hidden_version != version:
+            restricted_users = app.usecases.privileges.RESTRICTED_USERS
+
+            self._hidden = SortedScores()
+            for score in self._sorted.scores:
+                if score.user_id in restricted_users:
+                    self._hidden.insert(self.sort_value(score), score)
+
+            self._hidden_version = version
+
+        return self._hidden
+
+    def _count_hidden_before(self, index: int, user_id: int) -> int:
+        """Counts the scores ranked above `index` that are hidden from
+        `user_id` due to their owners being restricted."""
+
+        restricted_users = app.usecases.privileges.RESTRICTED_USERS
+        if not restricted_users:
+            return 0
+
+        hidden = self._hidden_scores()
+        if not hidden:
+            return 0
+
+        if index >= len(self._sorted):
+            hidden_count = len(hidden)
+        else:
+            sort_value = self.sort_value(self._sorted.scores[index])
+            hidden_count = hidden.count_greater(sort_value)
+
+            # scores tied with the one at `index` are only above it if they
+            # were inserted before it, which only the main ordering knows.
+            tied_start = self._sorted.count_greater(sort_value)
+            hidden_count += sum(
+                1
+                for score in self._sorted.scores[tied_start:index]
+                if score.user_id in restricted_users
+            )
+
+        # a restricted user still sees their own score.
+        own_score = self._user_scores.get(user_id)
+        if own_score is not None and user_id in restricted_users:
+            own_index = self._sorted.index(self.sort_value(own_score), own_score)
+            if own_index is not None and own_index < index:
+                hidden_count -= 1
+
+        return hidden_count
 
     async def find_user_score(
         self,
         user_id: int,
         unrestricted: bool = True,
     ) -> Optional[UserScore]:
+        score = self._user_scores.get(user_id)
+        if score is None:
+            return None
+
+        idx = self._sorted.index(self.sort_value(score), score)
+        assert idx is not None
+
         if unrestricted:
-            unrestricted_scores = await self.get_unrestricted_scores(user_id)
-        else:
-            unrestricted_scores = self.scores
+            idx -= self._count_hidden_before(idx, user_id)
 
-        for idx, score in enumerate(unrestricted_scores):
-            if score.user_id == user_id:
-                return {
-                    "score": score,
-                    "rank": idx + 1,
-                }
+        return {
+            "score": score,
+            "rank": idx + 1,
+        }
 
     async def find_score_rank(self, user_id: int, score_id: int) -> int:
-        unrestricted_scores = await self.get_unrestricted_scores(user_id)
+        score = self._user_scores.get(user_id)
+        if score is None or score.id != score_id:
+            return 0
 
-        for idx, score in enumerate(unrestricted_scores):
-            if score.id == score_id:
-                return idx + 1
+        result = await self.find_user_score(user_id)
+        assert result is not None
 
-        return 0
+        return result["rank"]
 
     async def get_unrestricted_scores(
         self,
         user_id: int,
         include_self: bool = True,
-    ) -> list[Score]:
-        scores = []
+        limit: Optional[int] = None,
+    ) -> list[LeaderboardScore]:
+        return _filter_unrestricted(self.scores, user_id, include_self, limit)
 
-        for score in self.scores:
-            import app.usecases.privileges  # hotfix until we fix the code.
+    async def get_country_scores(
+        self,
+        country: str,
+        user_id: int,
+        limit: Optional[int] = None,
+    ) -> list[LeaderboardScore]:
+        country_scores = self._country_scores.get(country)
+        if country_scores is None:
+            return []
 
-            user_privilege = await app.usecases.privileges.fetch(score.user_id)
-            if user_privilege.is_restricted and not (
-                score.user_id == user_id and include_self
-            ):
-                continue
+        return _filter_unrestricted(country_scores.scores, user_id, limit=limit)
 
-            scores.append(score)
+    async def get_mods_scores(
+        self,
+        mods: int,
+        user_id: int,
+        limit: Optional[int] = None,
+    ) -> list[LeaderboardScore]:
+        mods_scores = self._mods_scores.get(mods)
+        if mods_scores is None:
+            return []
 
-        return scores
+        return _filter_unrestricted(mods_scores.scores, user_id, limit=limit)
+
+    async def get_friends_scores(
+        self,
+        friends: frozenset[int],
+        user_id: int,
+        limit: Optional[int] = None,
+    ) -> list[LeaderboardScore]:
+        if len(friends) < len(self._user_scores):
+            scores = [
+                score
+                for friend_id in friends
+                if (score := self._user_scores.get(friend_id)) is not None
+            ]
+        else:
+            scores = [
+                score
+                for friend_id, score in self._user_scores.items()
+                if friend_id in friends
+            ]
+
+        # sorted by their position within the leaderboard to keep tie ordering.
+        scores.sort(
+            key=lambda score: self._sorted.index(self.sort_value(score), score),  # type: ignore
+        )
+        return _filter_unrestricted(scores, user_id, limit=limit)
 
     async def remove_user(self, user_id: int) -> None:
-        result = await self.find_user_score(user_id, unrestricted=False)
+        score = self._user_scores.pop(user_id, None)
 
-        if result is not None:
-            self.scores.remove(result["score"])
+        if score is not None:
+            self.rendered = {}
+            self._sorted.remove(self.sort_value(score), score)
+            self._remove_from_partitions(score)
 
     def sort(self) -> None:
-        if self.mode > Mode.MANIA:
-            sort = lambda score: score.pp
-        else:
-            sort = lambda score: score.score
+        """Rebuilds the ordering and all indexes from `scores`."""
+
+        scores = sorted(self.scores, key=self.sort_value, reverse=True)
 
-        self.scores = sorted(self.scores, key=sort, reverse=True)
+        self.rendered = {}
+        self._sorted = SortedScores()
+        self._user_scores = {}
+        self._country_scores = {}
+        self._mods_scores = {}
+        self._hidden_version = -1
+        for score in scores:
+            if score.user_id in self._user_scores:
+                continue  # only a user's best score may be on the leaderboard
+
+            self._insert(score)
+
+        self.scores = self._sorted.scores
 
     async def whatif_placement(
         self,
         user_id: int,
         sort_value: Union[int, float],
     ) -> int:
-        unrestricted_scores = await self.get_unrestricted_scores(user_id)
-
-        for idx, score in enumerate(unrestricted_scores):
-            if self.mode > Mode.MANIA:
-                sort_key = score.pp
-            else:
-                sort_key = score.score
+        idx = self._sorted.count_at_least(sort_value)
+        idx -= self._count_hidden_before(idx, user_id)
 
-            if sort_value > sort_key:
-                return idx + 1
+        # a score below every other one is placed last, rather than first.
+        return idx + 1
 
-        return 1
-
-    async def add_score(self, score: Score) -> None:
+    async def add_score(self, score: LeaderboardScore) -> None:
         await self.remove_user(score.user_id)
 
-        self.scores.append(score)
-        self.sort()
+        self.rendered = {}
+        self._insert(score)
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import Callable
+from typing import Generic
+from typing import Iterator
+from typing import Optional
+from typing import TypedDict
+from typing import TypeVar
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+class CacheStats(TypedDict):
+    size: int
+    max_size: int
+    hits: int
+    misses: int
+    hit_rate: float
+    evictions: int
+
+
+class LRUCache(Generic[K, V]):
+    """A size-bounded least recently used cache, with optional per-entry
+    expiry.
+
+    Note:
+        A `ttl` of `0` means entries never expire and are only ever
+        removed through eviction or explicit removal.
+
+        `on_remove` is called with every entry leaving the cache through
+        eviction, expiry or `pop`, but not `clear`.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl: float = 0,
+        on_remove: Optional[Callable[[K, V], None]] = None,
+    ) -> None:
+        self._entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self.max_size = max_size
+        self.ttl = ttl
+        self.on_remove = on_remove
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: K) -> bool:
+        return self._get_entry(key) is not None
+
+    def __iter__(self) -> Iterator[K]:
+        return iter(list(self._entries))
+
+    def _get_entry(self, key: K) -> Optional[tuple[float, V]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at and expires_at < time.monotonic():
+            del self._entries[key]
+
+            if self.on_remove is not None:
+                self.on_remove(key, value)
+
+            return None
+
+        return entry
+
+    def get(self, key: K) -> Optional[V]:
+        entry = self._get_entry(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def peek(self, key: K) -> Optional[V]:
+        """Fetches an entry without affecting its recency or the counters."""
+
+        entry = self._get_entry(key)
+        if entry is None:
+            return None
+
+        return entry[1]
+
+    def set(self, key: K, value: V, ttl: Optional[float] = None) -> None:
+        if ttl is None:
+            ttl = self.ttl
+
+        expires_at = time.monotonic() + ttl if ttl else 0.0
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            evicted_key, (_, evicted_value) = self._entries.popitem(last=False)
+            self.evictions += 1
+
+            if self.on_remove is not None:
+                self.on_remove(evicted_key, evicted_value)
+
+    def pop(self, key: K) -> Optional[V]:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+
+        if self.on_remove is not None:
+            self.on_remove(key, entry[1])
+
+        return entry[1]
+
+    def values(self) -> list[V]:
+        return [value for _, value in self._entries.values()]
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        if not lookups:
+            return 0.0
+
+        return self.hits / lookups
+
+    @property
+    def stats(self) -> CacheStats:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "evictions": self.evictions,
+        }
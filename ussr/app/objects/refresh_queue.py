@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+from typing import Awaitable
+from typing import Callable
+from typing import Generic
+from typing import Hashable
+from typing import Optional
+from typing import TypedDict
+from typing import TypeVar
+
+import app.utils
+import logger
+
+K = TypeVar("K", bound=Hashable)
+
+
+class RefreshQueueStats(TypedDict):
+    queued: int
+    running: int
+    refreshed: int
+    failed: int
+    dropped: int
+
+
+class RefreshQueue(Generic[K]):
+    """A queue of keys to refresh in the background, refreshing the most
+    requested keys first.
+
+    Note:
+        A key is only queued once, with requests for it while queued raising
+        its priority instead. Requests for keys which are being refreshed are
+        ignored, as are new keys once `max_size` keys are queued.
+    """
+
+    def __init__(self, refresh: Callable[[K], Awaitable[None]], max_size: int) -> None:
+        self._refresh = refresh
+        self.max_size = max_size
+
+        self._hits: dict[K, int] = {}
+        # (-hits, order, key), with outdated entries skipped when popped.
+        self._heap: list[tuple[int, int, K]] = []
+        self._order = itertools.count()
+
+        self._running: set[K] = set()
+        self._wakeup = asyncio.Event()
+
+        self.refreshed = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._hits)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._hits or key in self._running
+
+    def request(self, key: K) -> None:
+        if key in self._running:
+            return
+
+        hits = self._hits.get(key, 0)
+        if not hits and len(self._hits) >= self.max_size:
+            self.dropped += 1
+            return
+
+        self._hits[key] = hits + 1
+        heapq.heappush(self._heap, (-(hits + 1), next(self._order), key))
+
+        # keep outdated entries of frequently requested keys from piling up.
+        if len(self._heap) > 2 * self.max_size:
+            self._heap = [
+                (-key_hits, next(self._order), queued_key)
+                for queued_key, key_hits in self._hits.items()
+            ]
+            heapq.heapify(self._heap)
+
+        self._wakeup.set()
+
+    def _pop(self) -> Optional[K]:
+        while self._heap:
+            negative_hits, _, key = heapq.heappop(self._heap)
+            if self._hits.get(key) == -negative_hits:
+                del self._hits[key]
+                return key
+
+        return None
+
+    async def _worker(self) -> None:
+        while True:
+            key = self._pop()
+            if key is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            self._running.add(key)
+            try:
+                await self._refresh(key)
+                self.refreshed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Failed to refresh {key!r}: {e}")
+            finally:
+                self._running.discard(key)
+
+    async def run(self, concurrency: int) -> None:
+        """Refreshes queued keys with up to `concurrency` at once, until
+        cancelled."""
+
+        workers = [
+            app.utils.create_isolated_task(self._worker()) for _ in range(concurrency)
+        ]
+
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    @property
+    def stats(self) -> RefreshQueueStats:
+        return {
+            "queued": len(self._hits),
+            "running": len(self._running),
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Awaitable
+from typing import Callable
+from typing import Generic
+from typing import Hashable
+from typing import TypeVar
+
+import app.utils
+
+K = TypeVar("K", bound=Hashable)
+T = TypeVar("T")
+
+
+class SingleFlight(Generic[K, T]):
+    """Coalesces concurrent calls for the same key into a single call, with
+    every caller receiving its result.
+
+    Note:
+        The call runs as its own task, so a caller being cancelled (such as
+        by the client disconnecting) does not cancel it for the others.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[K, asyncio.Task[T]] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._calls
+
+    def _on_done(self, key: K, task: asyncio.Task[T]) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    async def run(self, key: K, func: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+
+            async def call() -> T:
+                return await func()
+
+            task = app.utils.create_isolated_task(call())
+            task.add_done_callback(lambda done: self._on_done(key, done))
+            self._calls[key] = task
+
+        return await asyncio.shield(task)
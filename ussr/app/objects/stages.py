@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any
+from typing import Awaitable
+from typing import TypeVar
+
+import app.utils
+
+T = TypeVar("T")
+
+
+class StageTimer:
+    """Times the named stages of a request, which may run concurrently.
+
+    Note:
+        Stages started through `start` run within their own context, meaning
+        they acquire their own database connection rather than queueing on
+        the request's connection.
+    """
+
+    __slots__ = ("start_time", "timings")
+
+    def __init__(self) -> None:
+        self.start_time = time.perf_counter_ns()
+        self.timings: dict[str, int] = {}
+
+    async def run(self, name: str, awaitable: Awaitable[T]) -> T:
+        start = time.perf_counter_ns()
+
+        try:
+            return await awaitable
+        finally:
+            self.timings[name] = time.perf_counter_ns() - start
+
+    def start(self, name: str, awaitable: Awaitable[T]) -> asyncio.Task[T]:
+        return app.utils.create_isolated_task(self.run(name, awaitable))
+
+    async def gather(self, **awaitables: Awaitable[Any]) -> list[Any]:
+        """Runs the given stages concurrently, returning their results in
+        order once all of them have finished.
+
+        Note:
+            If a stage raises (or the caller is cancelled), the others are
+            cancelled rather than left running.
+        """
+
+        tasks = [self.start(name, awaitable) for name, awaitable in awaitables.items()]
+
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+
+            raise
+
+    @property
+    def elapsed(self) -> int:
+        return time.perf_counter_ns() - self.start_time
+
+    def format(self) -> str:
+        return ", ".join(
+            f"{name}: {app.utils.format_time(timing)}"
+            for name, timing in self.timings.items()
+        )
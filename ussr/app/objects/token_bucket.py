@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import time
+
+
+class TokenBucket:
+    """A token bucket, allowing bursts of up to `capacity` actions while
+    limiting the sustained rate to `rate` actions per second."""
+
+    __slots__ = ("capacity", "rate", "_tokens", "_updated_at")
+
+    def __init__(self, capacity: float, rate: float) -> None:
+        self.capacity = capacity
+        self.rate = rate
+
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity,
+            self._tokens + (now - self._updated_at) * self.rate,
+        )
+        self._updated_at = now
+
+    @property
+    def tokens(self) -> float:
+        self._refill()
+        return self._tokens
+
+    def try_acquire(self) -> bool:
+        self._refill()
+
+        if self._tokens < 1:
+            return False
+
+        self._tokens -= 1
+        return True
+
+    def time_until_available(self) -> float:
+        """Returns the amount of seconds until a token is available."""
+
+        self._refill()
+
+        if self._tokens >= 1:
+            return 0.0
+
+        return (1 - self._tokens) / self.rate
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+from bisect import bisect_right
+from typing import NamedTuple
+
+# The amount of scores contributing to a user's pp and accuracy.
+TOP_SCORES_LIMIT = 100
+
+WEIGHTS = tuple(0.95**idx for idx in range(TOP_SCORES_LIMIT))
+
+
+class TopScore(NamedTuple):
+    pp: float
+    acc: float
+    map_md5: str
+
+
+class TopScores:
+    """A user's best scores on ranked beatmaps in a mode, ordered by pp, along
+    with the total amount of them.
+
+    Note:
+        Only the top `TOP_SCORES_LIMIT` scores are kept, which is all the
+        weighted pp and accuracy depend on. If a replacement lowers the pp of
+        one of these, the list may become incomplete and has to be reloaded.
+    """
+
+    __slots__ = ("scores", "_keys", "ranked_count")
+
+    def __init__(self, scores: list[TopScore], ranked_count: int) -> None:
+        self.scores = sorted(scores, key=lambda score: score.pp, reverse=True)
+        self._keys = [-score.pp for score in self.scores]
+        self.ranked_count = ranked_count
+
+    @property
+    def complete(self) -> bool:
+        return len(self.scores) >= min(self.ranked_count, TOP_SCORES_LIMIT)
+
+    def replace(self, score: TopScore, has_previous: bool) -> None:
+        """Adds a new best score, replacing the user's previous best score on
+        the same beatmap (if `has_previous`)."""
+
+        for idx, top_score in enumerate(self.scores):
+            if top_score.map_md5 == score.map_md5:
+                self.scores.pop(idx)
+                self._keys.pop(idx)
+                break
+
+        if not has_previous:
+            self.ranked_count += 1
+
+        idx = bisect_right(self._keys, -score.pp)
+        if idx == len(self.scores) and self.ranked_count - 1 > len(self.scores):
+            # it ranks below every kept score, so whether it is within the top
+            # scores depends on those which weren't kept.
+            return
+
+        self.scores.insert(idx, score)
+        self._keys.insert(idx, -score.pp)
+
+        del self.scores[TOP_SCORES_LIMIT:]
+        del self._keys[TOP_SCORES_LIMIT:]
+
+    @property
+    def weighted_pp(self) -> float:
+        return sum(score.pp * weight for score, weight in zip(self.scores, WEIGHTS))
+
+    @property
+    def accuracy(self) -> float:
+        total_acc = sum(
+            score.acc * weight for score, weight in zip(self.scores, WEIGHTS)
+        )
+        score_count = max(len(self.scores), 1)
+
+        return (total_acc * (100.0 / (20 * (1 - 0.95**score_count)))) / 100
+
+    @property
+    def bonus_pp(self) -> float:
+        return 416.6667 * (1 - (0.995 ** min(1000, self.ranked_count)))
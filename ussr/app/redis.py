@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import asyncio
+from typing import Any
 from typing import Awaitable
 from typing import Callable
 from typing import TypedDict
@@ -37,6 +38,11 @@ async def handle_beatmap_status_change(payload: str) -> None:
     It should be published with the payload being the beatmap's md5.
     """
 
+    await app.usecases.leaderboards.invalidate(payload)
+
+    # any cached top scores may include (or now miss) the beatmap's scores.
+    app.usecases.stats.TOP_SCORES_CACHE.clear()
+
     cached_beatmap = app.usecases.beatmap.md5_from_cache(payload)
     if not cached_beatmap:
         return
@@ -49,28 +55,84 @@ async def handle_beatmap_status_change(payload: str) -> None:
         # map's status changed, reflect it
         cached_beatmap.status = new_beatmap.status
 
-        # reflect changes in the cache
-        app.usecases.beatmap.MD5_CACHE[cached_beatmap.md5] = cached_beatmap
-        app.usecases.beatmap.ID_CACHE[cached_beatmap.id] = cached_beatmap
-        app.usecases.beatmap.add_to_set_cache(cached_beatmap)
+        # reflect changes in the cache, as its expiry depends on the status.
+        app.usecases.beatmap.BEATMAP_CACHE.add(cached_beatmap)
 
     logger.info(f"Updated {cached_beatmap.song_name} in cache!")
 
 
+class LeaderboardUpdate(TypedDict):
+    md5: str
+    mode: int
+    origin: str
+    score: list[Any]
+
+
+@register_pubsub("ussr:leaderboard_update")
+async def handle_leaderboard_update(payload: str) -> None:
+    """Pubsub to handle another worker adding a score to a redis backed
+    leaderboard, adding it to our copy of it too."""
+
+    update: LeaderboardUpdate = orjson.loads(payload)
+    if update["origin"] == app.state.WORKER_ID:
+        return
+
+    await app.usecases.leaderboards.apply_update(
+        update["md5"],
+        Mode(update["mode"]),
+        update["score"],
+    )
+
+
+class TopScoresChange(TypedDict):
+    user_id: int
+    mode: int
+    origin: str
+
+
+@register_pubsub("ussr:top_scores_change")
+async def handle_top_scores_change(payload: str) -> None:
+    """Pubsub to handle another worker changing a user's top scores, dropping
+    our now outdated copy of them."""
+
+    change: TopScoresChange = orjson.loads(payload)
+    if change["origin"] == app.state.WORKER_ID:
+        return
+
+    app.usecases.stats.invalidate_top_scores(change["user_id"], Mode(change["mode"]))
+
+
+@register_pubsub("peppy:ban")
+async def handle_user_ban(payload: str) -> None:
+    """Pubsub to handle user restrictions and bans.
+
+    It is published (by both USSR and the rest of the stack) with the payload
+    being the user's ID whenever their privileges change, so the restricted
+    user set can be refreshed.
+    """
+
+    user_id = int(payload)
+    await app.usecases.privileges.refresh(user_id)
+    app.usecases.leaderboards.clear_rendered()
+
+    logger.info(f"Refreshed the privileges of user ID {user_id}")
+
+
+@register_pubsub("peppy:change_username")
+async def handle_username_change(payload: str) -> None:
+    """Pubsub to handle username changes, dropping the user's cached display
+    information."""
+
+    username_change: UsernameChange = orjson.loads(payload)
+    app.usecases.display_info.invalidate(int(username_change["userID"]))
+    app.usecases.leaderboards.clear_rendered()
+
+
 @register_pubsub("ussr:recalculate_user")
 async def handle_user_recalculate(payload: str) -> None:
     user_id = int(payload)
 
-    for mode in Mode:
-        stats = await app.usecases.stats.fetch(user_id, mode)
-        if stats is None:
-            logger.warning(
-                f"Attempted to recalculate stats for user {user_id} but they don't exist!",
-            )
-            return
-        await app.usecases.stats.full_recalc(stats)
-        await app.usecases.stats.update_rank(stats)
-        await app.usecases.stats.save(stats)
+    await app.usecases.recalculation.recalculate_users((user_id,))
 
     logger.info(f"Recalculated user ID {user_id}")
 
@@ -79,20 +141,7 @@ async def handle_user_recalculate(payload: str) -> None:
 async def handle_user_recalculate_full(payload: str) -> None:
     user_id = int(payload)
 
-    for mode in Mode:
-        stats = await app.usecases.stats.fetch(user_id, mode)
-        if stats is None:
-            logger.warning(
-                f"Attempted to recalculate stats for user {user_id} but they don't exist!",
-            )
-            return
-        await app.usecases.stats.full_recalc(stats)
-        await app.usecases.stats.update_rank(stats)
-        await app.usecases.stats.calc_playcount(stats)
-        await app.usecases.stats.calc_max_combo(stats)
-        await app.usecases.stats.calc_total_score(stats)
-        await app.usecases.stats.calc_ranked_score(stats)
-        await app.usecases.stats.save(stats)
+    await app.usecases.recalculation.recalculate_users((user_id,), full=True)
 
     logger.info(f"Recalculated user ID {user_id}")
 
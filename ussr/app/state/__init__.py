@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import asyncio
+import uuid
 
 import logger
 
@@ -15,6 +16,9 @@ PUBSUB_HANDLER = Callable[[str], Awaitable[None]]
 
 PUBSUBS: dict[str, PUBSUB_HANDLER] = {}
 
+# Identifies this process in broadcasts to the other workers.
+WORKER_ID = uuid.uuid4().hex
+
 
 async def cancel_tasks() -> None:
     logger.info(f"Cancelling {len(tasks)} tasks.")
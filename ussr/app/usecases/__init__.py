@@ -2,13 +2,18 @@ from __future__ import annotations
 
 from . import beatmap
 from . import clans
+from . import counters
 from . import countries
 from . import discord
+from . import display_info
+from . import journal
 from . import leaderboards
+from . import osu_api
 from . import password
 from . import performance
 from . import pp_cap
 from . import privileges
+from . import recalculation
 from . import score
 from . import stats
 from . import user
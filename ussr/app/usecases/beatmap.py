@@ -1,33 +1,66 @@
 from __future__ import annotations
 
 import asyncio
-import random
 import time
 from typing import Any
 from typing import Optional
 
 import app.state
+import app.usecases.leaderboards
+import app.usecases.osu_api
 import settings
 from app.constants.mode import Mode
 from app.constants.ranked_status import RankedStatus
 from app.models.beatmap import Beatmap
+from app.objects.beatmap_cache import BeatmapCache
+from app.objects.refresh_queue import RefreshQueue
+from app.objects.single_flight import SingleFlight
 
-MD5_CACHE: dict[str, Beatmap] = {}
-ID_CACHE: dict[int, Beatmap] = {}
-SET_CACHE: dict[int, list[Beatmap]] = {}
+BEATMAP_CACHE = BeatmapCache(
+    max_size=settings.BEATMAP_CACHE_SIZE,
+    unranked_ttl=settings.BEATMAP_CACHE_UNRANKED_TTL,
+)
+
+# In-flight lookups and updates, shared by concurrent callers for a beatmap.
+MD5_FLIGHTS: SingleFlight[str, Optional[Beatmap]] = SingleFlight()
+ID_FLIGHTS: SingleFlight[int, Optional[Beatmap]] = SingleFlight()
+SET_FLIGHTS: SingleFlight[int, Optional[list[Beatmap]]] = SingleFlight()
+UPDATE_FLIGHTS: SingleFlight[int, Optional[Beatmap]] = SingleFlight()
 
 
 async def update_beatmap(beatmap: Beatmap) -> Optional[Beatmap]:
     if not beatmap.deserves_update:
         return beatmap
 
-    new_beatmap = await id_from_api(beatmap.id)
+    # it may have been updated by another request since it was fetched.
+    cached_beatmap = id_from_cache(beatmap.id)
+    if cached_beatmap is not None and not cached_beatmap.deserves_update:
+        return cached_beatmap
+
+    return await UPDATE_FLIGHTS.run(beatmap.id, lambda: _update_beatmap(beatmap))
+
+
+async def _update_beatmap(beatmap: Beatmap) -> Optional[Beatmap]:
+    beatmaps = await _make_get_beatmaps_request({"b": beatmap.id})
+    if beatmaps is None:
+        # the osu!api couldn't be reached, which says nothing about the
+        # beatmap, so it's kept as it is until the next update.
+        return beatmap
+
+    for api_beatmap in beatmaps:
+        asyncio.create_task(save(api_beatmap))
+
+    new_beatmap = next(
+        (api_beatmap for api_beatmap in beatmaps if api_beatmap.id == beatmap.id),
+        None,
+    )
     if new_beatmap:
         # handle deleting the old beatmap etc.
 
         if new_beatmap.md5 != beatmap.md5:
             # delete any instances of the old map
-            MD5_CACHE.pop(beatmap.md5, None)
+            BEATMAP_CACHE.remove(beatmap.md5)
+            await app.usecases.leaderboards.invalidate(beatmap.md5)
 
             asyncio.create_task(
                 app.state.services.database.execute(
@@ -41,6 +74,7 @@ async def update_beatmap(beatmap: Beatmap) -> Optional[Beatmap]:
                 new_beatmap.status = beatmap.status
     else:
         # it's now unsubmitted!
+        BEATMAP_CACHE.remove(beatmap.md5)
         asyncio.create_task(
             app.state.services.database.execute(
                 "DELETE FROM beatmaps WHERE beatmap_md5 = :old_md5",
@@ -54,25 +88,50 @@ async def update_beatmap(beatmap: Beatmap) -> Optional[Beatmap]:
     new_beatmap.last_update = int(time.time())
 
     asyncio.create_task(save(new_beatmap))  # i don't trust mysql for some reason
-    MD5_CACHE[new_beatmap.md5] = new_beatmap
-    ID_CACHE[new_beatmap.id] = new_beatmap
+    BEATMAP_CACHE.add(new_beatmap)
 
     return new_beatmap
 
 
+async def _refresh_beatmap(id: int) -> None:
+    # it may have left the cache while queued.
+    beatmap = id_from_cache(id) or await id_from_database(id)
+    if beatmap is None or not beatmap.deserves_update:
+        return
+
+    await update_beatmap(beatmap)
+
+
+# Outdated beatmaps, updated in the background while still being served.
+REFRESH_QUEUE: RefreshQueue[int] = RefreshQueue(
+    _refresh_beatmap,
+    max_size=settings.BEATMAP_REFRESH_QUEUE_SIZE,
+)
+
+
+def request_update(beatmap: Beatmap) -> None:
+    """Queues the beatmap to be updated in the background if it is outdated,
+    with the cached version being replaced once it has been."""
+
+    if beatmap.deserves_update:
+        REFRESH_QUEUE.request(beatmap.id)
+
+
 async def fetch_by_md5(md5: str) -> Optional[Beatmap]:
     if beatmap := md5_from_cache(md5):
         return beatmap
 
+    return await MD5_FLIGHTS.run(md5, lambda: _fetch_by_md5(md5))
+
+
+async def _fetch_by_md5(md5: str) -> Optional[Beatmap]:
     if beatmap := await md5_from_database(md5):
-        MD5_CACHE[md5] = beatmap
-        ID_CACHE[beatmap.id] = beatmap
+        BEATMAP_CACHE.add(beatmap)
 
         return beatmap
 
     if beatmap := await md5_from_api(md5):
-        MD5_CACHE[md5] = beatmap
-        ID_CACHE[beatmap.id] = beatmap
+        BEATMAP_CACHE.add(beatmap)
 
         return beatmap
 
@@ -81,15 +140,17 @@ async def fetch_by_id(id: int) -> Optional[Beatmap]:
     if beatmap := id_from_cache(id):
         return beatmap
 
+    return await ID_FLIGHTS.run(id, lambda: _fetch_by_id(id))
+
+
+async def _fetch_by_id(id: int) -> Optional[Beatmap]:
     if beatmap := await id_from_database(id):
-        MD5_CACHE[beatmap.md5] = beatmap
-        ID_CACHE[beatmap.id] = beatmap
+        BEATMAP_CACHE.add(beatmap)
 
         return beatmap
 
     if beatmap := await id_from_api(id):
-        MD5_CACHE[beatmap.md5] = beatmap
-        ID_CACHE[beatmap.id] = beatmap
+        BEATMAP_CACHE.add(beatmap)
 
         return beatmap
 
@@ -98,46 +159,29 @@ async def fetch_by_set_id(set_id: int) -> Optional[list[Beatmap]]:
     if beatmaps := set_from_cache(set_id):
         return beatmaps
 
-    if beatmaps := await set_from_database(set_id):
-        for beatmap in beatmaps:
-            MD5_CACHE[beatmap.md5] = beatmap
-            ID_CACHE[beatmap.id] = beatmap
+    return await SET_FLIGHTS.run(set_id, lambda: _fetch_by_set_id(set_id))
 
-            add_to_set_cache(beatmap)
 
+async def _fetch_by_set_id(set_id: int) -> Optional[list[Beatmap]]:
+    if beatmaps := await set_from_database(set_id):
+        BEATMAP_CACHE.add_set(set_id, beatmaps)
         return beatmaps
 
     if beatmaps := await set_from_api(set_id):
-        for beatmap in beatmaps:
-            MD5_CACHE[beatmap.md5] = beatmap
-            ID_CACHE[beatmap.id] = beatmap
-
-            add_to_set_cache(beatmap)
-
+        BEATMAP_CACHE.add_set(set_id, beatmaps)
         return beatmaps
 
 
-def add_to_set_cache(beatmap: Beatmap) -> None:
-    if set_list := SET_CACHE.get(beatmap.set_id):
-        for _map in set_list:
-            if _map.id == beatmap.id or _map.md5 == beatmap.md5:
-                set_list.remove(_map)
-
-        set_list.append(beatmap)
-    else:
-        SET_CACHE[beatmap.set_id] = [beatmap]
-
-
 def set_from_cache(set_id: int) -> Optional[list[Beatmap]]:
-    return SET_CACHE.get(set_id)
+    return BEATMAP_CACHE.get_set(set_id)
 
 
 def md5_from_cache(md5: str) -> Optional[Beatmap]:
-    return MD5_CACHE.get(md5)
+    return BEATMAP_CACHE.get_by_md5(md5)
 
 
 def id_from_cache(id: int) -> Optional[Beatmap]:
-    return ID_CACHE.get(id)
+    return BEATMAP_CACHE.get_by_id(id)
 
 
 async def md5_from_database(md5: str) -> Optional[Beatmap]:
@@ -189,26 +233,116 @@ async def save(beatmap: Beatmap) -> None:
     )
 
 
-GET_BEATMAP_URL = "https://old.ppy.sh/api/get_beatmaps"
-GET_BEATMAP_FALLBACK_URL = settings.API_FALLBACK_URL + "/get_beatmaps"
+# Columns written by `save_many`, in order.
+BEATMAP_COLUMNS = (
+    "beatmap_id",
+    "beatmapset_id",
+    "beatmap_md5",
+    "song_name",
+    "ar",
+    "od",
+    "mode",
+    "rating",
+    "difficulty_std",
+    "difficulty_taiko",
+    "difficulty_ctb",
+    "difficulty_mania",
+    "max_combo",
+    "hit_length",
+    "bpm",
+    "playcount",
+    "passcount",
+    "ranked",
+    "latest_update",
+    "ranked_status_freezed",
+    "file_name",
+)
+
+
+async def save_many(beatmaps: list[Beatmap]) -> list[str]:
+    """Saves many beatmaps from the osu!api at once, returning the md5s of
+    previously saved beatmaps whose status changed or which were replaced by
+    a new version.
+
+    Note:
+        Unlike `save`, this keeps the playcount, passcount and difficulty
+        ratings of beatmaps already saved, along with the status of frozen
+        ones. As in `update_beatmap`, a new version of a frozen beatmap
+        keeps the status of the old one.
+    """
+
+    if not beatmaps:
+        return []
+
+    # The IDs are ints, so they are safe to inline into the query.
+    ids = ",".join(str(int(beatmap.id)) for beatmap in beatmaps)
+    db_beatmaps = await app.state.services.database.fetch_all(
+        "SELECT beatmap_id, beatmap_md5, ranked, ranked_status_freezed "
+        f"FROM beatmaps WHERE beatmap_id IN ({ids})",
+    )
+
+    saved: dict[int, list[Any]] = {}
+    for db_beatmap in db_beatmaps:
+        saved.setdefault(db_beatmap["beatmap_id"], []).append(db_beatmap)
+
+    changed_md5s: list[str] = []
+    outdated_md5s: list[str] = []
+    for beatmap in beatmaps:
+        for db_beatmap in saved.get(beatmap.id, ()):
+            if db_beatmap["beatmap_md5"] != beatmap.md5:
+                if db_beatmap["ranked_status_freezed"]:
+                    beatmap.status = RankedStatus(db_beatmap["ranked"])
+                    beatmap.frozen = True
+
+                outdated_md5s.append(db_beatmap["beatmap_md5"])
+            elif (
+                not db_beatmap["ranked_status_freezed"]
+                and db_beatmap["ranked"] != beatmap.status.value
+            ):
+                changed_md5s.append(beatmap.md5)
+
+    params: dict[str, Any] = {}
+    rows: list[str] = []
+    for idx, beatmap in enumerate(beatmaps):
+        params |= {
+            f"{column}_{idx}": value for column, value in beatmap.db_dict.items()
+        }
+        rows.append(
+            "(" + ", ".join(f":{column}_{idx}" for column in BEATMAP_COLUMNS) + ")",
+        )
+
+    async with app.state.services.database.transaction():
+        if outdated_md5s:
+            await app.state.services.database.execute_many(
+                "DELETE FROM beatmaps WHERE beatmap_md5 = :md5",
+                [{"md5": md5} for md5 in outdated_md5s],
+            )
+
+        # `ranked` is assigned first, as it depends on the previous freeze.
+        await app.state.services.database.execute(
+            f"INSERT INTO beatmaps ({', '.join(BEATMAP_COLUMNS)}) "
+            f"VALUES {', '.join(rows)} "
+            "ON DUPLICATE KEY UPDATE "
+            "ranked = IF(ranked_status_freezed = 1, ranked, VALUES(ranked)), "
+            "ranked_status_freezed = GREATEST(ranked_status_freezed, VALUES(ranked_status_freezed)), "
+            "beatmap_id = VALUES(beatmap_id), beatmapset_id = VALUES(beatmapset_id), "
+            "song_name = VALUES(song_name), ar = VALUES(ar), od = VALUES(od), "
+            "mode = VALUES(mode), max_combo = VALUES(max_combo), "
+            "hit_length = VALUES(hit_length), bpm = VALUES(bpm), "
+            "latest_update = VALUES(latest_update), file_name = VALUES(file_name)",
+            params,
+        )
+
+    return changed_md5s + outdated_md5s
 
 
 async def _make_get_beatmaps_request(args: dict[str, Any]) -> Optional[list[Beatmap]]:
-    url = GET_BEATMAP_FALLBACK_URL
-    if settings.API_KEYS_POOL:
-        url = GET_BEATMAP_URL
-        args["k"] = random.choice(settings.API_KEYS_POOL)
-
-    async with app.state.services.http.get(
-        url,
-        params=args,
-    ) as response:
-        if not response or response.status != 200:
-            return None
-
-        response_json = await response.json()
-        if not response_json:
-            return None
+    """Returns the beatmaps matching `args`, or `None` if the osu!api could
+    not be reached (as opposed to an empty list if none were found)."""
+
+    response_json = await app.usecases.osu_api.get_beatmaps(args)
+    if response_json is None:
+        return None
 
     return parse_from_osu_api(response_json)
 
@@ -223,7 +357,6 @@ async def md5_from_api(md5: str) -> Optional[Beatmap]:
 
     for beatmap in beatmaps:
         asyncio.create_task(save(beatmap))
-        add_to_set_cache(beatmap)
 
     for beatmap in beatmaps:
         if beatmap.md5 == md5:
@@ -241,7 +374,6 @@ async def id_from_api(id: int, should_save: bool = True) -> Optional[Beatmap]:
     if should_save:
         for beatmap in beatmaps:
             asyncio.create_task(save(beatmap))
-            add_to_set_cache(beatmap)
 
     for beatmap in beatmaps:
         if beatmap.id == id:
@@ -258,7 +390,6 @@ async def set_from_api(id: int) -> Optional[list[Beatmap]]:
 
     for beatmap in beatmaps:
         asyncio.create_task(save(beatmap))
-        add_to_set_cache(beatmap)
 
     return beatmaps
 
@@ -297,8 +428,9 @@ def parse_from_osu_api(
             max_combo = 0
 
         ranked_status = RankedStatus.from_osu_api(int(response_json["approved"]))
-        if ranked_status in FROZEN_STATUSES:
-            frozen = True  # beatmaps are always frozen when ranked/approved/loved
+
+        # beatmaps are always frozen when ranked/approved/loved
+        beatmap_frozen = frozen or ranked_status in FROZEN_STATUSES
 
         mode = Mode(int(response_json["mode"]))
 
@@ -331,20 +463,9 @@ def parse_from_osu_api(
                 max_combo=max_combo,
                 bpm=bpm,
                 filename=filename,
-                frozen=frozen,
+                frozen=beatmap_frozen,
                 rating=10.0,
             ),
         )
 
     return maps
-
-
-async def increment_playcount(beatmap: Beatmap, passcount: bool = True) -> None:
-    beatmap.plays += 1
-    if passcount:
-        beatmap.passes += 1
-
-    await app.state.services.database.execute(
-        "UPDATE beatmaps SET passcount = :pass, playcount = :play WHERE beatmap_md5 = :md5",
-        {"play": beatmap.plays, "pass": beatmap.passes, "md5": beatmap.md5},
-    )
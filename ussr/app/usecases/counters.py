@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+import asyncio
+
+import logger
+from app.objects.counters import Counters
+
+# Increments which are not worth a write each, such as replays watched.
+COUNTERS = Counters()
+
+
+async def flush_loop(interval: float) -> None:
+    try:
+        while True:
+            await asyncio.sleep(interval)
+
+            try:
+                await COUNTERS.flush()
+            except Exception as e:
+                logger.error(f"Failed to flush counters: {e}")
+    except asyncio.CancelledError:
+        # write anything left while the database is still available.
+        await COUNTERS.flush()
+        raise
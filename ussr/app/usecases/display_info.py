@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+from typing import Iterable
+from typing import NamedTuple
+
+import app.state.services
+import settings
+from app.objects.lru import LRUCache
+
+
+class UserDisplayInfo(NamedTuple):
+    user_id: int
+    username: str
+    country: str
+    clan_tag: str
+
+    @property
+    def display_name(self) -> str:
+        if self.clan_tag:
+            return f"[{self.clan_tag}] {self.username}"
+
+        return self.username
+
+
+# Username changes are applied through `peppy:change_username`, while nothing
+# announces clan changes, so clan tags only update once their entry expires.
+DISPLAY_INFO_CACHE: LRUCache[int, UserDisplayInfo] = LRUCache(
+    max_size=settings.USER_INFO_CACHE_SIZE,
+    ttl=settings.USER_INFO_CACHE_TTL,
+)
+
+
+def _unknown_user(user_id: int) -> UserDisplayInfo:
+    return UserDisplayInfo(user_id, "", "XX", "")  # xd
+
+
+async def fetch_many(user_ids: Iterable[int]) -> dict[int, UserDisplayInfo]:
+    """Fetches the username, country and clan tag of many users at once,
+    querying the database only for those not already cached."""
+
+    results: dict[int, UserDisplayInfo] = {}
+    missing: set[int] = set()
+
+    for user_id in user_ids:
+        if user_id in results:
+            continue
+
+        if info := DISPLAY_INFO_CACHE.get(user_id):
+            results[user_id] = info
+        else:
+            missing.add(user_id)
+
+    if not missing:
+        return results
+
+    # The IDs are ints, so they are safe to inline into the query.
+    db_users = await app.state.services.database.fetch_all(
+        "SELECT u.id, u.username, u.country, c.tag FROM users u "
+        "LEFT JOIN user_clans uc ON uc.user = u.id LEFT JOIN clans c ON uc.clan = c.id "
+        f"WHERE u.id IN ({','.join(str(int(user_id)) for user_id in missing)})",
+    )
+
+    for db_user in db_users:
+        user_id = db_user["id"]
+        if user_id not in missing:
+            continue  # a user in multiple clans, first one wins.
+
+        info = UserDisplayInfo(
+            user_id=user_id,
+            username=db_user["username"] or "",
+            country=db_user["country"] or "XX",
+            clan_tag=db_user["tag"] or "",
+        )
+        DISPLAY_INFO_CACHE.set(user_id, info)
+
+        results[user_id] = info
+        missing.discard(user_id)
+
+    for user_id in missing:
+        results[user_id] = info = _unknown_user(user_id)
+        DISPLAY_INFO_CACHE.set(user_id, info)
+
+    return results
+
+
+async def fetch(user_id: int) -> UserDisplayInfo:
+    return (await fetch_many((user_id,)))[user_id]
+
+
+def invalidate(user_id: int) -> None:
+    DISPLAY_INFO_CACHE.pop(user_id)
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import Counter
+from typing import Any
+
+import app.state.services
+import app.usecases
+import app.utils
+import logger
+import settings
+from app.constants.mode import Mode
+from app.models.beatmap import Beatmap
+from app.models.score import Score
+from app.objects.counters import Counters
+from app.objects.counters import FLUSH_CHUNK_SIZE
+from app.objects.journal import Journal
+
+# Side effects of score submissions which are not required for the response,
+# written to the database in batches by `flush`.
+JOURNAL = Journal(settings.JOURNAL_PATH)
+
+
+def record_user_playcount(score: Score, beatmap: Beatmap) -> None:
+    JOURNAL.append(
+        {
+            "type": "user_playcount",
+            "user_id": score.user_id,
+            "beatmap_id": beatmap.id,
+            "mode": score.mode.as_vn,
+        },
+    )
+
+
+def record_latest_activity(user_id: int) -> None:
+    JOURNAL.append(
+        {
+            "type": "latest_activity",
+            "user_id": user_id,
+            "time": int(time.time()),
+        },
+    )
+
+
+def record_beatmap_playcount(beatmap: Beatmap, passcount: bool = True) -> None:
+    beatmap.plays += 1
+    if passcount:
+        beatmap.passes += 1
+
+    JOURNAL.append(
+        {
+            "type": "beatmap_playcount",
+            "md5": beatmap.md5,
+            "passcount": passcount,
+        },
+    )
+
+
+def record_playtime(score: Score, beatmap: Beatmap) -> None:
+    JOURNAL.append(
+        {
+            "type": "playtime",
+            "user_id": score.user_id,
+            "mode": score.mode.value,
+            "playtime": app.usecases.score.get_non_computed_playtime(score, beatmap),
+        },
+    )
+
+
+def _chunks(items: list[Any]) -> list[list[Any]]:
+    return [
+        items[idx : idx + FLUSH_CHUNK_SIZE]
+        for idx in range(0, len(items), FLUSH_CHUNK_SIZE)
+    ]
+
+
+def _case(
+    key_column: str,
+    values: list[tuple[Any, Any]],
+    name: str,
+) -> tuple[str, dict[str, Any]]:
+    """Builds a `CASE` expression mapping each key of `key_column` to a value."""
+
+    params: dict[str, Any] = {}
+    whens: list[str] = []
+
+    for idx, (key, value) in enumerate(values):
+        params[f"{name}_key_{idx}"] = key
+        params[f"{name}_value_{idx}"] = value
+        whens.append(f"WHEN :{name}_key_{idx} THEN :{name}_value_{idx}")
+
+    return f"CASE {key_column} {' '.join(whens)} END", params
+
+
+def _in_list(values: list[tuple[Any, Any]], name: str) -> tuple[str, dict[str, Any]]:
+    params = {f"{name}_in_{idx}": key for idx, (key, _) in enumerate(values)}
+    return ", ".join(f":{param}" for param in params), params
+
+
+async def _flush_user_playcounts(playcounts: Counter[tuple[int, int, int]]) -> None:
+    for chunk in _chunks(list(playcounts.items())):
+        params: dict[str, Any] = {}
+        rows: list[str] = []
+
+        for idx, ((user_id, beatmap_id, mode), playcount) in enumerate(chunk):
+            params |= {
+                f"user_id_{idx}": user_id,
+                f"beatmap_id_{idx}": beatmap_id,
+                f"game_mode_{idx}": mode,
+                f"playcount_{idx}": playcount,
+            }
+            rows.append(
+                f"(:user_id_{idx}, :beatmap_id_{idx}, :game_mode_{idx}, :playcount_{idx})",
+            )
+
+        await app.state.services.database.execute(
+            "INSERT INTO users_beatmap_playcount (user_id, beatmap_id, game_mode, playcount) "
+            f"VALUES {', '.join(rows)} "
+            "ON DUPLICATE KEY UPDATE playcount = playcount + VALUES(playcount)",
+            params,
+        )
+
+
+async def _flush_latest_activity(activity: dict[int, int]) -> None:
+    for chunk in _chunks(list(activity.items())):
+        case, case_params = _case("id", chunk, "time")
+        in_list, in_params = _in_list(chunk, "id")
+
+        await app.state.services.database.execute(
+            f"UPDATE users SET latest_activity = GREATEST(latest_activity, {case}) "
+            f"WHERE id IN ({in_list})",
+            case_params | in_params,
+        )
+
+
+async def flush() -> int:
+    """Writes all journalled side effects to the database, returning the
+    amount of entries written."""
+
+    entries = JOURNAL.take()
+    if not entries:
+        JOURNAL.complete()  # drop any empty files which were taken.
+        return 0
+
+    user_playcounts: Counter[tuple[int, int, int]] = Counter()
+    latest_activity: dict[int, int] = {}
+    counters = Counters()
+
+    for entry in entries:
+        try:
+            entry_type = entry["type"]
+
+            if entry_type == "user_playcount":
+                key = (entry["user_id"], entry["beatmap_id"], entry["mode"])
+                user_playcounts[key] += 1
+            elif entry_type == "latest_activity":
+                latest_activity[entry["user_id"]] = max(
+                    latest_activity.get(entry["user_id"], 0),
+                    entry["time"],
+                )
+            elif entry_type == "beatmap_playcount":
+                counters.add("beatmaps", "beatmap_md5", "playcount", entry["md5"])
+                if entry["passcount"]:
+                    counters.add("beatmaps", "beatmap_md5", "passcount", entry["md5"])
+            elif entry_type == "playtime":
+                mode = Mode(entry["mode"])
+                counters.add(
+                    mode.stats_table,
+                    "id",
+                    f"playtime_{mode.stats_prefix}",
+                    entry["user_id"],
+                    entry["playtime"],
+                )
+            else:
+                logger.warning(f"Skipping unknown journal entry type: {entry_type}")
+        except (KeyError, TypeError, ValueError) as e:
+            # a malformed entry must not keep the rest from being written.
+            logger.warning(f"Skipping invalid journal entry {entry!r}: {e}")
+
+    # a transaction to keep the window in which a crash leads to entries being
+    # written twice as small as possible.
+    async with app.state.services.database.transaction():
+        await _flush_user_playcounts(user_playcounts)
+        await _flush_latest_activity(latest_activity)
+        await counters.flush()
+
+    JOURNAL.complete()
+    return len(entries)
+
+
+async def flush_loop(interval: float) -> None:
+    try:
+        while True:
+            try:
+                start = time.perf_counter_ns()
+                if flushed := await flush():
+                    formatted_time = app.utils.format_time(
+                        time.perf_counter_ns() - start,
+                    )
+                    logger.debug(
+                        f"Flushed {flushed} journal entries in {formatted_time}",
+                    )
+            except Exception as e:
+                logger.error(f"Failed to flush the submission journal: {e}")
+
+            await asyncio.sleep(interval)
+    except asyncio.CancelledError:
+        # write anything left while the database is still available.
+        await flush()
+        JOURNAL.close()
+        raise
@@ -1,17 +1,107 @@
 from __future__ import annotations
 
+import asyncio
+import time
+from typing import Any
+from typing import Optional
+
 import app.state.services
+import app.utils
+import logger
+import orjson
+import settings
 from app.constants.mode import Mode
 from app.models.beatmap import Beatmap
+from app.models.score import LeaderboardScore
 from app.models.score import Score
 from app.objects.leaderboard import Leaderboard
+from app.objects.lru import LRUCache
+from app.objects.single_flight import SingleFlight
+
+LEADERBOARD_CACHE: LRUCache[tuple[str, Mode], Leaderboard] = LRUCache(
+    max_size=settings.LEADERBOARD_CACHE_SIZE,
+    ttl=settings.LEADERBOARD_CACHE_TTL,
+)
+
+# Loads of uncached leaderboards, along with whether they are still current.
+LOAD_FLIGHTS: SingleFlight[tuple[str, Mode], tuple[Leaderboard, bool]] = SingleFlight()
+
+# The keys of leaderboards changed while they were being loaded, as the load
+# may have missed the change.
+CHANGED_LOADS: set[tuple[str, Mode]] = set()
+
+# How many times a leaderboard changed during its load is loaded again.
+LOAD_ATTEMPTS = 3
+
+# Whether the startup leaderboard preload has finished.
+PRELOADED = False
+
+REDIS_LEADERBOARD_TTL = 3600
+
+# Present in the scores hash of every leaderboard saved to redis, so empty
+# leaderboards are told apart from missing ones.
+REDIS_PRESENT_FIELD = "present"
+
+LEADERBOARD_SCORE_COLUMNS = ", ".join(
+    f"s.`{column}`" for column in LeaderboardScore.COLUMNS
+)
 
 
 async def fetch(beatmap: Beatmap, mode: Mode) -> Leaderboard:
+    key = (beatmap.md5, mode)
+
+    for _ in range(LOAD_ATTEMPTS):
+        leaderboard = LEADERBOARD_CACHE.get(key)
+        if leaderboard is not None:
+            return leaderboard
+
+        leaderboard, current = await LOAD_FLIGHTS.run(
+            key,
+            lambda: _load(beatmap, mode),
+        )
+        if current:
+            return leaderboard
+
+    # it kept changing while being loaded, so is handed out without caching.
+    return leaderboard
+
+
+async def _load(beatmap: Beatmap, mode: Mode) -> tuple[Leaderboard, bool]:
+    key = (beatmap.md5, mode)
+    CHANGED_LOADS.discard(key)
+
+    leaderboard = None
+    redis_version = 0
+    if settings.REDIS_LEADERBOARDS:
+        leaderboard, redis_version = await fetch_redis(beatmap, mode)
+
+    from_db = leaderboard is None
+    if leaderboard is None:
+        leaderboard = await fetch_db(beatmap, mode)
+
+    if key in CHANGED_LOADS:
+        CHANGED_LOADS.discard(key)
+        return leaderboard, False
+
+    if from_db and settings.REDIS_LEADERBOARDS:
+        await save_redis(beatmap, leaderboard, redis_version)
+
+    LEADERBOARD_CACHE.set(key, leaderboard)
+    return leaderboard, True
+
+
+def mark_changed(key: tuple[str, Mode]) -> None:
+    if key in LOAD_FLIGHTS:
+        CHANGED_LOADS.add(key)
+
+
+async def fetch_db(beatmap: Beatmap, mode: Mode) -> Leaderboard:
     leaderboard = Leaderboard(mode)
 
     db_scores = await app.state.services.database.fetch_all(
-        f"SELECT * FROM {mode.scores_table} WHERE beatmap_md5 = :md5 AND play_mode = :mode AND completed = 3",
+        f"SELECT {LEADERBOARD_SCORE_COLUMNS}, u.country FROM {mode.scores_table} s "
+        "LEFT JOIN users u ON u.id = s.userid "
+        "WHERE s.beatmap_md5 = :md5 AND s.play_mode = :mode AND s.completed = 3",
         {
             "md5": beatmap.md5,
             "mode": mode.as_vn,
@@ -19,8 +109,265 @@ async def fetch(beatmap: Beatmap, mode: Mode) -> Leaderboard:
     )
 
     for db_score in db_scores:
-        score = Score.from_dict(db_score)
+        score = LeaderboardScore.from_row(db_score)
         leaderboard.scores.append(score)
 
     leaderboard.sort()
     return leaderboard
+
+
+def _redis_keys(map_md5: str, mode: Mode) -> tuple[str, str, str]:
+    key = f"ussr:leaderboard:{map_md5}:{mode.value}"
+    return key, f"{key}:scores", f"{key}:version"
+
+
+# Saves a leaderboard loaded from the database, unless it was saved or changed
+# (bumping its version) since the load started.
+SAVE_LEADERBOARD_SCRIPT = app.state.services.redis.register_script(
+    """
+    local version = redis.call("GET", KEYS[3]) or "0"
+    if version ~= ARGV[1] or redis.call("EXISTS", KEYS[2]) == 1 then
+        return 0
+    end
+
+    redis.call("HSET", KEYS[2], ARGV[3], "")
+    for i = 4, #ARGV, 3 do
+        redis.call("ZADD", KEYS[1], ARGV[i + 1], ARGV[i])
+        redis.call("HSET", KEYS[2], ARGV[i], ARGV[i + 2])
+    end
+
+    redis.call("EXPIRE", KEYS[1], ARGV[2])
+    redis.call("EXPIRE", KEYS[2], ARGV[2])
+    return 1
+    """,
+)
+
+# Adds a score to a saved leaderboard, bumping its version either way. A
+# leaderboard which isn't saved is left to be loaded in full instead.
+ADD_SCORE_SCRIPT = app.state.services.redis.register_script(
+    """
+    redis.call("INCR", KEYS[3])
+    redis.call("EXPIRE", KEYS[3], ARGV[4])
+    if redis.call("EXISTS", KEYS[2]) == 0 then
+        return 0
+    end
+
+    redis.call("ZADD", KEYS[1], ARGV[2], ARGV[1])
+    redis.call("HSET", KEYS[2], ARGV[1], ARGV[3])
+    redis.call("EXPIRE", KEYS[1], ARGV[4])
+    redis.call("EXPIRE", KEYS[2], ARGV[4])
+    return 1
+    """,
+)
+
+
+def _score_to_payload(score: LeaderboardScore) -> bytes:
+    return orjson.dumps(score.payload)
+
+
+def _score_from_payload(payload: bytes) -> LeaderboardScore:
+    return LeaderboardScore.from_payload(orjson.loads(payload))
+
+
+async def fetch_redis(
+    beatmap: Beatmap,
+    mode: Mode,
+) -> tuple[Optional[Leaderboard], int]:
+    """Fetches a leaderboard from the sorted set shared between all workers,
+    along with its version. The leaderboard is `None` if it is not present
+    in redis, in which case the version is to be passed to `save_redis`."""
+
+    order_key, scores_key, version_key = _redis_keys(beatmap.md5, mode)
+
+    pipeline = app.state.services.redis.pipeline(transaction=True)
+    pipeline.zrevrange(order_key, 0, -1)
+    pipeline.hgetall(scores_key)
+    pipeline.get(version_key)
+    user_ids, payloads, version = await pipeline.execute()
+
+    # the present field is only missing if the leaderboard is.
+    if not payloads:
+        return None, int(version or 0)
+
+    leaderboard = Leaderboard(
+        mode,
+        [
+            _score_from_payload(payloads[user_id])
+            for user_id in user_ids
+            if user_id in payloads
+        ],
+    )
+    return leaderboard, int(version or 0)
+
+
+async def save_redis(beatmap: Beatmap, leaderboard: Leaderboard, version: int) -> None:
+    """Saves a leaderboard loaded from the database to redis, unless another
+    worker saved it or a score was added to it since `version` was fetched."""
+
+    args: list[Any] = [version, REDIS_LEADERBOARD_TTL, REDIS_PRESENT_FIELD]
+    for score in leaderboard.scores:
+        args += (
+            score.user_id,
+            leaderboard.sort_value(score),
+            _score_to_payload(score),
+        )
+
+    await SAVE_LEADERBOARD_SCRIPT(
+        keys=_redis_keys(beatmap.md5, leaderboard.mode),
+        args=args,
+    )
+
+
+async def add_score(
+    beatmap: Beatmap,
+    leaderboard: Leaderboard,
+    score: Score,
+    country: str,
+) -> None:
+    """Adds a new best score to a leaderboard, propagating it to the shared
+    redis leaderboard and the other workers if enabled."""
+
+    mark_changed((beatmap.md5, leaderboard.mode))
+
+    leaderboard_score = LeaderboardScore.from_score(score, country)
+    await leaderboard.add_score(leaderboard_score)
+
+    if not settings.REDIS_LEADERBOARDS:
+        return
+
+    await ADD_SCORE_SCRIPT(
+        keys=_redis_keys(beatmap.md5, leaderboard.mode),
+        args=[
+            score.user_id,
+            leaderboard.sort_value(leaderboard_score),
+            _score_to_payload(leaderboard_score),
+            REDIS_LEADERBOARD_TTL,
+        ],
+    )
+
+    # sent along, so the other workers add it to their copies in place.
+    await app.state.services.redis.publish(
+        "ussr:leaderboard_update",
+        orjson.dumps(
+            {
+                "md5": beatmap.md5,
+                "mode": leaderboard.mode.value,
+                "origin": app.state.WORKER_ID,
+                "score": leaderboard_score.payload,
+            },
+        ),
+    )
+
+
+async def apply_update(map_md5: str, mode: Mode, payload: list[Any]) -> None:
+    """Adds a score added by another worker to our copy of the leaderboard,
+    if we have one."""
+
+    key = (map_md5, mode)
+    mark_changed(key)
+
+    leaderboard = LEADERBOARD_CACHE.peek(key)
+    if leaderboard is not None:
+        await leaderboard.add_score(LeaderboardScore.from_payload(payload))
+
+
+async def invalidate(map_md5: str) -> None:
+    """Removes all cached leaderboards for a beatmap, along with the ones
+    saved to redis, forcing them to be refetched from the database on next
+    access."""
+
+    for mode in Mode:
+        mark_changed((map_md5, mode))
+        LEADERBOARD_CACHE.pop((map_md5, mode))
+
+    if not settings.REDIS_LEADERBOARDS:
+        return
+
+    pipeline = app.state.services.redis.pipeline(transaction=True)
+    for mode in Mode:
+        order_key, scores_key, version_key = _redis_keys(map_md5, mode)
+        pipeline.delete(order_key, scores_key)
+        # keeps loads which started before now from saving an outdated copy.
+        pipeline.incr(version_key)
+        pipeline.expire(version_key, REDIS_LEADERBOARD_TTL)
+    await pipeline.execute()
+
+
+def clear_rendered() -> None:
+    """Drops the pre-rendered score rows of every cached leaderboard. Used
+    when something affecting every leaderboard (such as a restriction or a
+    username change) happens."""
+
+    for leaderboard in LEADERBOARD_CACHE.values():
+        leaderboard.rendered = {}
+
+
+async def preload(count: int, concurrency: int) -> None:
+    """Loads the leaderboards of the `count` most played beatmaps with
+    leaderboards of every mode into the cache."""
+
+    global PRELOADED
+
+    start = time.perf_counter_ns()
+
+    if count * len(Mode) > LEADERBOARD_CACHE.max_size:
+        logger.warning(
+            f"Preloading {count * len(Mode)} leaderboards into a cache of "
+            f"{LEADERBOARD_CACHE.max_size}, some will be evicted immediately!",
+        )
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def preload_leaderboard(beatmap: Beatmap, mode: Mode) -> bool:
+        async with semaphore:
+            try:
+                await fetch(beatmap, mode)
+            except Exception as e:
+                logger.error(
+                    f"Failed to preload the {mode!r} leaderboard of {beatmap.md5}: {e}",
+                )
+                return False
+
+            return True
+
+    loaded = 0
+    try:
+        for mode_vn in (Mode.STD, Mode.TAIKO, Mode.CATCH, Mode.MANIA):
+            db_beatmaps = await app.state.services.database.fetch_all(
+                "SELECT * FROM beatmaps WHERE mode = :mode AND ranked IN (2, 3, 4, 5) "
+                "ORDER BY playcount DESC LIMIT :limit",
+                {"mode": mode_vn.value, "limit": count},
+            )
+            beatmaps = [Beatmap.from_dict(db_beatmap) for db_beatmap in db_beatmaps]
+
+            for mode in Mode:
+                if mode.as_vn != mode_vn:
+                    continue
+
+                mode_start = time.perf_counter_ns()
+                tasks = [
+                    app.utils.create_isolated_task(preload_leaderboard(beatmap, mode))
+                    for beatmap in beatmaps
+                ]
+                try:
+                    mode_loaded = sum(await asyncio.gather(*tasks))
+                finally:
+                    # don't leave them running unowned if we were cancelled.
+                    for task in tasks:
+                        task.cancel()
+
+                loaded += mode_loaded
+                formatted_time = app.utils.format_time(
+                    time.perf_counter_ns() - mode_start,
+                )
+                logger.info(
+                    f"Preloaded {mode_loaded} {mode!r} leaderboards in {formatted_time}",
+                )
+    except Exception as e:
+        logger.error(f"Failed to preload leaderboards: {e}")
+    finally:
+        # preloading is best effort, so report it as done either way.
+        PRELOADED = True
+
+    formatted_time = app.utils.format_time(time.perf_counter_ns() - start)
+    logger.info(f"Finished preloading {loaded} leaderboards in {formatted_time}!")
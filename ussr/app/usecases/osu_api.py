@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import Counter
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import Optional
+from typing import TypedDict
+
+import aiohttp
+import app.state.services
+import logger
+import settings
+from app.objects.circuit_breaker import CircuitBreaker
+from app.objects.histogram import Histogram
+from app.objects.histogram import HistogramStats
+from app.objects.single_flight import SingleFlight
+from app.objects.token_bucket import TokenBucket
+
+GET_BEATMAPS_URL = "https://old.ppy.sh/api/get_beatmaps"
+GET_BEATMAPS_FALLBACK_URL = settings.API_FALLBACK_URL + "/get_beatmaps"
+
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=settings.API_TIMEOUT)
+
+# Upper bounds of the latency histogram buckets, in milliseconds.
+LATENCY_BOUNDS = (50.0, 100.0, 250.0, 500.0, 1000.0, 2500.0, 5000.0)
+
+
+@dataclass
+class Endpoint:
+    name: str
+    url: str
+    requires_key: bool
+
+    circuit: CircuitBreaker = field(
+        default_factory=lambda: CircuitBreaker(
+            failure_threshold=settings.API_CIRCUIT_FAILURES,
+            cooldown=settings.API_CIRCUIT_COOLDOWN,
+        ),
+    )
+    latency: Histogram = field(default_factory=lambda: Histogram(LATENCY_BOUNDS))
+    requests: int = 0
+    errors: Counter[str] = field(default_factory=Counter)
+
+
+# Endpoints in order of preference, falling back to the next while one fails.
+ENDPOINTS: list[Endpoint] = []
+if settings.API_KEYS_POOL:
+    ENDPOINTS.append(Endpoint("osu", GET_BEATMAPS_URL, requires_key=True))
+ENDPOINTS.append(Endpoint("fallback", GET_BEATMAPS_FALLBACK_URL, requires_key=False))
+
+# The request budget of each key, refilled continuously.
+KEY_BUDGETS: dict[str, TokenBucket] = {
+    key: TokenBucket(
+        capacity=settings.API_KEY_RATE_LIMIT,
+        rate=settings.API_KEY_RATE_LIMIT / 60,
+    )
+    for key in settings.API_KEYS_POOL
+}
+
+# Identical requests in flight, shared by concurrent callers.
+REQUEST_FLIGHTS: SingleFlight[
+    tuple[tuple[str, Any], ...],
+    Optional[list[dict[str, Any]]],
+] = SingleFlight()
+
+
+async def _acquire_key() -> Optional[str]:
+    """Takes a request from the budget of the key with the most remaining,
+    waiting for one to refill for up to `API_KEY_WAIT` seconds."""
+
+    waited = 0.0
+    while True:
+        key, budget = max(KEY_BUDGETS.items(), key=lambda item: item[1].tokens)
+        if budget.try_acquire():
+            return key
+
+        wait_time = budget.time_until_available()
+        if waited + wait_time > settings.API_KEY_WAIT:
+            return None
+
+        await asyncio.sleep(wait_time)
+        waited += wait_time
+
+
+async def _request(
+    endpoint: Endpoint,
+    params: dict[str, Any],
+) -> tuple[Optional[list[dict[str, Any]]], Optional[str]]:
+    """Makes a single request to an endpoint, returning either its response
+    or the kind of error which occurred."""
+
+    start = time.perf_counter()
+    endpoint.requests += 1
+
+    try:
+        async with app.state.services.http.get(
+            endpoint.url,
+            params=params,
+            timeout=REQUEST_TIMEOUT,
+        ) as response:
+            if response.status != 200:
+                return None, f"status_{response.status}"
+
+            return await response.json() or [], None
+    except asyncio.TimeoutError:
+        return None, "timeout"
+    except aiohttp.ClientError:
+        return None, "connection"
+    except ValueError:
+        return None, "invalid_response"
+    finally:
+        endpoint.latency.observe((time.perf_counter() - start) * 1000)
+
+
+async def _get_beatmaps(params: dict[str, Any]) -> Optional[list[dict[str, Any]]]:
+    for endpoint in ENDPOINTS:
+        # checked before taking from the key budgets, so a failing endpoint
+        # doesn't use them up.
+        if not endpoint.circuit.allow():
+            endpoint.errors["circuit_open"] += 1
+            continue
+
+        request_params = dict(params)
+        if endpoint.requires_key:
+            api_key = await _acquire_key()
+            if api_key is None:
+                endpoint.circuit.release()
+                endpoint.errors["rate_limited"] += 1
+                continue
+
+            request_params["k"] = api_key
+
+        response_json, error = await _request(endpoint, request_params)
+        if error is None:
+            endpoint.circuit.record_success()
+            return response_json
+
+        endpoint.errors[error] += 1
+        endpoint.circuit.record_failure()
+
+        if endpoint.circuit.failures == endpoint.circuit.failure_threshold:
+            logger.warning(
+                f"The {endpoint.name} osu!api is failing ({error}), not using it "
+                f"for {endpoint.circuit.cooldown} seconds.",
+            )
+
+    return None
+
+
+async def get_beatmaps(params: dict[str, Any]) -> Optional[list[dict[str, Any]]]:
+    """Makes a `get_beatmaps` request, returning `None` if every endpoint
+    failed or an empty list if nothing was found.
+
+    Note:
+        Concurrent identical requests (such as many lookups of the same set)
+        are merged into a single one.
+    """
+
+    return await REQUEST_FLIGHTS.run(
+        tuple(sorted(params.items())),
+        lambda: _get_beatmaps(params),
+    )
+
+
+class EndpointStats(TypedDict):
+    circuit: str
+    requests: int
+    errors: dict[str, int]
+    latency_ms: HistogramStats
+
+
+class ApiStats(TypedDict):
+    endpoints: dict[str, EndpointStats]
+    available_keys: int
+
+
+def stats() -> ApiStats:
+    return {
+        "endpoints": {
+            endpoint.name: {
+                "circuit": endpoint.circuit.state.value,
+                "requests": endpoint.requests,
+                "errors": dict(endpoint.errors),
+                "latency_ms": endpoint.latency.stats,
+            }
+            for endpoint in ENDPOINTS
+        },
+        "available_keys": sum(
+            1 for budget in KEY_BUDGETS.values() if budget.tokens >= 1
+        ),
+    }
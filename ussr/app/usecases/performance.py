@@ -1,35 +1,257 @@
 from __future__ import annotations
 
+import asyncio
 import hashlib
+import os
+import time
+import uuid
+from typing import Optional
 from typing import TypedDict
 
+import aiohttp
 import app.state
+import logger
 import settings
 from app.constants.mode import Mode
 from app.models.score import Score
+from app.objects.batcher import Batcher
+from app.objects.file_index import FileIndex
+from app.objects.file_store import FileStore
 from app.objects.path import Path
+from app.objects.single_flight import SingleFlight
 
 OSU_BASE_URL = "https://old.ppy.sh/osu"
 if not settings.API_KEYS_POOL:
     OSU_BASE_URL = settings.API_OSU_FALLBACK_URL
 
+# The md5s of beatmap files which have already been hashed.
+FILE_INDEX = FileIndex(settings.BEATMAP_FILE_INDEX_PATH)
+
+# Every version of every beatmap file seen, by md5.
+FILE_ARCHIVE = FileStore(settings.DATA_BEATMAP_ARCHIVE_DIRECTORY)
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+# How stale a beatmap file's access time may get before a use updates it.
+FILE_ACCESS_RESOLUTION_NS = 24 * 60 * 60 * 1_000_000_000
+
+# Downloads in flight, shared by concurrent checks of the same beatmap.
+DOWNLOAD_FLIGHTS: SingleFlight[tuple[int, str], bool] = SingleFlight()
+
+_download_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def _hash_file(file_path: str) -> str:
+    md5 = hashlib.md5()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            md5.update(chunk)
+
+    return md5.hexdigest()
+
+
+async def _local_file_md5(osu_file_path: Path, map_id: int) -> Optional[str]:
+    try:
+        stat = os.stat(str(osu_file_path))
+    except FileNotFoundError:
+        return None
+
+    # its access time is kept current (at a coarse resolution, as this is a
+    # write), so the file is not pruned while in use.
+    now = time.time_ns()
+    if now - stat.st_atime_ns > FILE_ACCESS_RESOLUTION_NS:
+        try:
+            os.utime(str(osu_file_path), ns=(now, stat.st_mtime_ns))
+        except FileNotFoundError:
+            return None
+
+    md5 = FILE_INDEX.get(map_id, stat.st_size, stat.st_mtime_ns)
+    if md5 is None:
+        md5 = await asyncio.to_thread(_hash_file, str(osu_file_path))
+        FILE_INDEX.set(map_id, stat.st_size, stat.st_mtime_ns, md5)
+
+    return md5
+
 
 async def check_local_file(osu_file_path: Path, map_id: int, map_md5: str) -> bool:
-    if (
-        not osu_file_path.exists()
-        or hashlib.md5(osu_file_path.read_bytes()).hexdigest() != map_md5
-    ):
+    if await _local_file_md5(osu_file_path, map_id) == map_md5:
+        return True
+
+    return await DOWNLOAD_FLIGHTS.run(
+        (map_id, map_md5),
+        lambda: _download_file(osu_file_path, map_id, map_md5),
+    )
+
+
+def _get_download_semaphore() -> asyncio.Semaphore:
+    # created lazily, as it has to be created within the running loop.
+    global _download_semaphore
+    if _download_semaphore is None:
+        _download_semaphore = asyncio.Semaphore(settings.BEATMAP_DOWNLOAD_CONCURRENCY)
+
+    return _download_semaphore
+
+
+def _is_osu_file(osu_file: bytes) -> bool:
+    return b"osu file format" in osu_file.split(b"\n", 1)[0]
+
+
+def _write_file(osu_file_path: Path, osu_file: bytes, md5: str) -> None:
+    # keep the version being replaced, for scores set on it.
+    try:
+        old_osu_file = osu_file_path.read_bytes()
+    except FileNotFoundError:
+        pass
+    else:
+        if _is_osu_file(old_osu_file):
+            FILE_ARCHIVE.put(hashlib.md5(old_osu_file).hexdigest(), old_osu_file)
+
+    FILE_ARCHIVE.put(md5, osu_file)
+
+    # written to a temporary file first, so readers never see a partial one.
+    # it is unique to this write, as other workers (or hosts) may be writing
+    # the same file at once.
+    temp_path = f"{osu_file_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(osu_file)
+
+        os.replace(temp_path, str(osu_file_path))
+    except OSError:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+
+        # another writer may have put the same file in place first.
+        try:
+            if _hash_file(str(osu_file_path)) == md5:
+                return
+        except FileNotFoundError:
+            pass
+
+        raise
+
+
+async def _download_file(osu_file_path: Path, map_id: int, map_md5: str) -> bool:
+    osu_file = await asyncio.to_thread(FILE_ARCHIVE.get, map_md5)
+    if osu_file is not None:
+        await _save_file(osu_file_path, map_id, osu_file, map_md5)
+        return True
+
+    async with _get_download_semaphore():
+        # it may have been downloaded while waiting.
+        if await _local_file_md5(osu_file_path, map_id) == map_md5:
+            return True
+
         async with app.state.services.http.get(
             f"{OSU_BASE_URL}/{map_id}",
         ) as response:
             if response.status != 200:
                 return False
 
-            osu_file_path.write_bytes(await response.read())
+            osu_file = await response.read()
 
+    if not _is_osu_file(osu_file):
+        logger.warning(f"Downloaded an invalid .osu file for beatmap {map_id}.")
+        return False
+
+    osu_file_md5 = hashlib.md5(osu_file).hexdigest()
+    if osu_file_md5 != map_md5:
+        logger.warning(
+            f"Downloaded .osu file for beatmap {map_id} has the md5 {osu_file_md5}, "
+            f"rather than {map_md5}.",
+        )
+        return False
+
+    await _save_file(osu_file_path, map_id, osu_file, osu_file_md5)
     return True
 
 
+async def _save_file(
+    osu_file_path: Path,
+    map_id: int,
+    osu_file: bytes,
+    md5: str,
+) -> None:
+    await asyncio.to_thread(_write_file, osu_file_path, osu_file, md5)
+
+    # spare hashing it again on the next check.
+    stat = os.stat(str(osu_file_path))
+    FILE_INDEX.set(map_id, stat.st_size, stat.st_mtime_ns, md5)
+
+
+async def save_file_index_loop(interval: float) -> None:
+    try:
+        while True:
+            await asyncio.sleep(interval)
+
+            if FILE_INDEX.dirty:
+                try:
+                    await asyncio.to_thread(FILE_INDEX.write, FILE_INDEX.take_changes())
+                except Exception as e:
+                    logger.error(f"Failed to save the beatmap file index: {e}")
+    except asyncio.CancelledError:
+        if FILE_INDEX.dirty:
+            FILE_INDEX.write(FILE_INDEX.take_changes())
+        raise
+
+
+def _prune_files(max_idle_ns: int) -> int:
+    pruned = 0
+    now = time.time_ns()
+
+    with os.scandir(settings.DATA_BEATMAP_DIRECTORY) as entries:
+        for entry in entries:
+            map_id, extension = os.path.splitext(entry.name)
+            if extension != ".osu" or not map_id.isdigit() or not entry.is_file():
+                continue
+
+            try:
+                if now - entry.stat().st_atime_ns < max_idle_ns:
+                    continue
+
+                with open(entry.path, "rb") as f:
+                    osu_file = f.read()
+            except FileNotFoundError:
+                continue
+
+            if not _is_osu_file(osu_file):
+                continue
+
+            # archived first, so it is restored without downloading it again.
+            FILE_ARCHIVE.put(hashlib.md5(osu_file).hexdigest(), osu_file)
+
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+
+            pruned += 1
+
+    return pruned
+
+
+async def prune_files_loop(interval: float, max_idle: float) -> None:
+    """Removes beatmap files which were not used for `max_idle` seconds,
+    keeping only their archived copies, every `interval` seconds."""
+
+    while True:
+        await asyncio.sleep(interval)
+
+        try:
+            pruned = await asyncio.to_thread(_prune_files, int(max_idle * 1e9))
+        except Exception as e:
+            logger.error(f"Failed to prune beatmap files: {e}")
+            continue
+
+        if pruned:
+            logger.info(f"Pruned {pruned} unused beatmap files.")
+
+
+CALCULATE_TIMEOUT = aiohttp.ClientTimeout(total=settings.PERFORMANCE_SERVICE_TIMEOUT)
+
+
 class PerformanceScore(TypedDict):
     beatmap_id: int
     mode: int
@@ -45,6 +267,7 @@ async def calculate_performances(
     async with app.state.services.http.post(
         f"{settings.PERFORMANCE_SERVICE_URL}/api/v1/calculate",
         json=scores,
+        timeout=CALCULATE_TIMEOUT,
     ) as resp:
         if resp.status != 200:
             return [(0.0, 0.0)] * len(scores)
@@ -53,6 +276,15 @@ async def calculate_performances(
         return [(result["pp"], result["stars"]) for result in data]
 
 
+# Concurrent calculations of single scores, sent to the service together.
+PERFORMANCE_BATCHER: Batcher[PerformanceScore, tuple[float, float]] = Batcher(
+    calculate_performances,
+    max_size=settings.PERFORMANCE_BATCH_SIZE,
+    window=settings.PERFORMANCE_BATCH_WINDOW / 1000,
+    max_pending=settings.PERFORMANCE_MAX_PENDING,
+)
+
+
 # TODO: split sr & pp calculations
 async def calculate_performance(
     beatmap_id: int,
@@ -62,24 +294,23 @@ async def calculate_performance(
     acc: float,
     nmiss: int,
 ) -> tuple[float, float]:
-    async with app.state.services.http.post(
-        f"{settings.PERFORMANCE_SERVICE_URL}/api/v1/calculate",
-        json=[
-            {
-                "beatmap_id": beatmap_id,
-                "mode": mode.as_vn,
-                "mods": mods,
-                "max_combo": max_combo,
-                "accuracy": acc,
-                "miss_count": nmiss,
-            },
-        ],
-    ) as resp:
-        if resp.status != 200:
-            return 0.0, 0.0
-
-        data = (await resp.json())[0]
-        return data["pp"], data["stars"]
+    try:
+        return await asyncio.wait_for(
+            PERFORMANCE_BATCHER.submit(
+                {
+                    "beatmap_id": beatmap_id,
+                    "mode": mode.as_vn,
+                    "mods": mods,
+                    "max_combo": max_combo,
+                    "accuracy": acc,
+                    "miss_count": nmiss,
+                },
+            ),
+            timeout=settings.PERFORMANCE_SERVICE_TIMEOUT,
+        )
+    except asyncio.TimeoutError:
+        logger.warning(f"Timed out calculating performance on beatmap {beatmap_id}.")
+        return 0.0, 0.0
 
 
 async def calculate_score(score: Score, beatmap_id: int) -> None:
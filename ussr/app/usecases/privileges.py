@@ -1,8 +1,14 @@
 from __future__ import annotations
 
 import app.state.services
+import logger
 from app.constants.privileges import Privileges
 
+RESTRICTED_USERS: set[int] = set()
+
+# Incremented whenever `RESTRICTED_USERS` changes, for anything derived from it.
+RESTRICTED_USERS_VERSION = 0
+
 
 async def fetch(user_id: int) -> Privileges:
     db_privilege = await app.state.services.database.fetch_val(
@@ -14,3 +20,46 @@ async def fetch(user_id: int) -> Privileges:
         return Privileges(2)  # assume restricted? xd
 
     return Privileges(db_privilege)
+
+
+def is_restricted(user_id: int) -> bool:
+    return user_id in RESTRICTED_USERS
+
+
+async def init_restricted_users() -> None:
+    """Loads the IDs of all restricted users into `RESTRICTED_USERS`."""
+
+    global RESTRICTED_USERS_VERSION
+
+    # A user is restricted unless they have both USER_PUBLIC and USER_NORMAL.
+    db_users = await app.state.services.database.fetch_all(
+        "SELECT id FROM users WHERE privileges & 3 != 3",
+    )
+
+    RESTRICTED_USERS.clear()
+    RESTRICTED_USERS.update(db_user["id"] for db_user in db_users)
+    RESTRICTED_USERS_VERSION += 1
+
+    logger.info(f"Loaded {len(RESTRICTED_USERS)} restricted users!")
+
+
+async def refresh(user_id: int) -> None:
+    """Re-reads a user's privileges, updating their `RESTRICTED_USERS`
+    membership."""
+
+    privileges = await fetch(user_id)
+    set_restricted(user_id, privileges.is_restricted)
+
+
+def set_restricted(user_id: int, restricted: bool) -> None:
+    global RESTRICTED_USERS_VERSION
+
+    if restricted == (user_id in RESTRICTED_USERS):
+        return
+
+    if restricted:
+        RESTRICTED_USERS.add(user_id)
+    else:
+        RESTRICTED_USERS.discard(user_id)
+
+    RESTRICTED_USERS_VERSION += 1
@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from typing import Any
+from typing import Iterable
+from typing import Optional
+
+import app.state.services
+import app.usecases.display_info
+import app.usecases.privileges
+import app.usecases.stats
+from app.constants.mode import Mode
+from app.objects.top_scores import TOP_SCORES_LIMIT
+from app.objects.top_scores import TopScore
+from app.objects.top_scores import TopScores
+
+# Every mode stored within each scores table, by `play_mode`.
+TABLE_MODES: dict[str, dict[int, Mode]] = {
+    table: {mode.as_vn: mode for mode in Mode if mode.scores_table == table}
+    for table in ("scores", "scores_relax", "scores_ap")
+}
+
+
+# Max amount of users updated by a single statement.
+UPDATE_CHUNK_SIZE = 500
+
+
+def _in_list(user_ids: list[int]) -> str:
+    # The IDs are ints, so they are safe to inline into the query.
+    return ",".join(str(int(user_id)) for user_id in user_ids)
+
+
+async def _fetch_top_scores(
+    table: str,
+    user_ids: list[int],
+) -> dict[tuple[int, Mode], list[TopScore]]:
+    """Fetches the top scores of every mode stored in a table for all of the
+    given users, in a single query."""
+
+    db_scores = await app.state.services.database.fetch_all(
+        "SELECT userid, play_mode, pp, accuracy, beatmap_md5 FROM ("
+        "SELECT s.userid, s.play_mode, s.pp, s.accuracy, s.beatmap_md5, "
+        "ROW_NUMBER() OVER (PARTITION BY s.userid, s.play_mode ORDER BY s.pp DESC) AS position "
+        f"FROM {table} s INNER JOIN beatmaps b USING(beatmap_md5) "
+        f"WHERE s.completed = 3 AND b.ranked IN (2, 3) AND s.userid IN ({_in_list(user_ids)})"
+        ") top_scores WHERE position <= :limit",
+        {"limit": TOP_SCORES_LIMIT},
+    )
+
+    modes = TABLE_MODES[table]
+    top_scores: defaultdict[tuple[int, Mode], list[TopScore]] = defaultdict(list)
+    for db_score in db_scores:
+        mode = modes.get(db_score["play_mode"])
+        if mode is None:
+            continue
+
+        top_scores[db_score["userid"], mode].append(
+            TopScore(db_score["pp"], db_score["accuracy"], db_score["beatmap_md5"]),
+        )
+
+    return top_scores
+
+
+async def _fetch_totals(
+    table: str,
+    user_ids: list[int],
+) -> dict[tuple[int, Mode], dict[str, Any]]:
+    """Fetches the score totals of every mode stored in a table for all of the
+    given users, in a single query."""
+
+    db_totals = await app.state.services.database.fetch_all(
+        "SELECT s.userid, s.play_mode, COUNT(*) AS playcount, "
+        "MAX(s.max_combo) AS max_combo, SUM(s.score) AS total_score, "
+        "SUM(IF(s.completed = 3 AND b.ranked IN (2, 3), s.score, 0)) AS ranked_score, "
+        "SUM(s.completed = 3 AND b.ranked IN (2, 3)) AS ranked_count "
+        f"FROM {table} s LEFT JOIN beatmaps b USING(beatmap_md5) "
+        f"WHERE s.userid IN ({_in_list(user_ids)}) GROUP BY s.userid, s.play_mode",
+    )
+
+    modes = TABLE_MODES[table]
+    totals: dict[tuple[int, Mode], dict[str, Any]] = {}
+    for db_total in db_totals:
+        mode = modes.get(db_total["play_mode"])
+        if mode is None:
+            continue
+
+        totals[db_total["userid"], mode] = {
+            "playcount": db_total["playcount"],
+            "max_combo": db_total["max_combo"] or 0,
+            "total_score": int(db_total["total_score"] or 0),
+            "ranked_score": int(db_total["ranked_score"] or 0),
+            "ranked_count": int(db_total["ranked_count"] or 0),
+        }
+
+    return totals
+
+
+async def _update_stats(
+    table: str,
+    columns: dict[str, str],
+    updates: list[dict[str, Any]],
+) -> None:
+    """Updates the stats of many users in a single statement, setting each
+    column to the value of its key in each user's update."""
+
+    params: dict[str, Any] = {}
+    assignments: list[str] = []
+
+    for column, key in columns.items():
+        whens: list[str] = []
+        for idx, update in enumerate(updates):
+            params[f"{key}_{idx}"] = update[key]
+            whens.append(f"WHEN {int(update['id'])} THEN :{key}_{idx}")
+
+        assignments.append(f"{column} = CASE id {' '.join(whens)} END")
+
+    await app.state.services.database.execute(
+        f"UPDATE {table} SET {', '.join(assignments)} "
+        f"WHERE id IN ({_in_list([update['id'] for update in updates])})",
+        params,
+    )
+
+
+async def recalculate_users(
+    user_ids: Iterable[int],
+    full: bool = False,
+    modes: Optional[Iterable[Mode]] = None,
+) -> None:
+    """Recalculates the pp and accuracy of many users at once, along with their
+    playcount, max combo, total score and ranked score if `full`."""
+
+    # unknown users have to be skipped, as they would be added to the rankings.
+    display_infos = await app.usecases.display_info.fetch_many(user_ids)
+    user_ids = [
+        user_id
+        for user_id, display_info in display_infos.items()
+        if display_info.username
+    ]
+    if not user_ids:
+        return
+
+    modes = list(modes) if modes is not None else list(Mode)
+
+    top_scores: dict[tuple[int, Mode], list[TopScore]] = {}
+    totals: dict[tuple[int, Mode], dict[str, Any]] = {}
+    for table in {mode.scores_table for mode in modes}:
+        top_scores |= await _fetch_top_scores(table, user_ids)
+        totals |= await _fetch_totals(table, user_ids)
+
+    restricted_users = app.usecases.privileges.RESTRICTED_USERS
+
+    pipeline = app.state.services.redis.pipeline(transaction=False)
+    for mode in modes:
+        updates: list[dict[str, Any]] = []
+
+        for user_id in user_ids:
+            user_totals = totals.get((user_id, mode), {})
+            user_top_scores = TopScores(
+                top_scores.get((user_id, mode), []),
+                user_totals.get("ranked_count", 0),
+            )
+
+            # keep submissions from having to load these again.
+            if (user_id, mode) in app.usecases.stats.TOP_SCORES_CACHE:
+                app.usecases.stats.TOP_SCORES_CACHE.set(
+                    (user_id, mode),
+                    user_top_scores,
+                )
+
+            pp = user_top_scores.weighted_pp + user_top_scores.bonus_pp
+            update = {
+                "id": user_id,
+                "pp": pp,
+                "accuracy": user_top_scores.accuracy,
+            }
+
+            if full:
+                update |= {
+                    "playcount": user_totals.get("playcount", 0),
+                    "max_combo": user_totals.get("max_combo", 0),
+                    "total_score": user_totals.get("total_score", 0),
+                    "ranked_score": user_totals.get("ranked_score", 0),
+                }
+
+            updates.append(update)
+
+            if user_id in restricted_users:
+                continue
+
+            pipeline.zadd(
+                f"ripple:{mode.redis_leaderboard}:{mode.stats_prefix}",
+                {user_id: pp},
+            )
+            country = display_infos[user_id].country
+            pipeline.zadd(
+                f"ripple:{mode.redis_leaderboard}:{mode.stats_prefix}:{country.lower()}",
+                {user_id: pp},
+            )
+
+        columns = {
+            f"pp_{mode.stats_prefix}": "pp",
+            f"avg_accuracy_{mode.stats_prefix}": "accuracy",
+        }
+        if full:
+            columns |= {
+                f"playcount_{mode.stats_prefix}": "playcount",
+                f"max_combo_{mode.stats_prefix}": "max_combo",
+                f"total_score_{mode.stats_prefix}": "total_score",
+                f"ranked_score_{mode.stats_prefix}": "ranked_score",
+            }
+
+        for idx in range(0, len(updates), UPDATE_CHUNK_SIZE):
+            await _update_stats(
+                mode.stats_table,
+                columns,
+                updates[idx : idx + UPDATE_CHUNK_SIZE],
+            )
+
+    await pipeline.execute()
@@ -6,8 +6,16 @@ from typing import Optional
 
 import app.state
 import app.usecases
+import orjson
+import settings
 from app.constants.mode import Mode
+from app.constants.ranked_status import RankedStatus
+from app.models.beatmap import Beatmap
+from app.models.score import Score
 from app.models.stats import Stats
+from app.objects.lru import LRUCache
+from app.objects.top_scores import TopScore
+from app.objects.top_scores import TopScores
 
 
 class StatsInfo(NamedTuple):
@@ -49,57 +57,123 @@ class RankInfo(NamedTuple):
     country_rank: int
 
 
-async def get_redis_rank(user_id: int, mode: Mode) -> RankInfo:
-    redis_global_rank = await app.state.services.redis.zrevrank(
-        f"ripple:{mode.redis_leaderboard}:{mode.stats_prefix}",
-        user_id,
-    )
-    global_rank = int(redis_global_rank) + 1 if redis_global_rank else 0
+def _rank_keys(mode: Mode, country: str) -> tuple[str, str]:
+    key = f"ripple:{mode.redis_leaderboard}:{mode.stats_prefix}"
+    return key, f"{key}:{country.lower()}"
 
-    country = await app.usecases.countries.get_country(user_id)
-    redis_country_rank = await app.state.services.redis.zrevrank(
-        f"ripple:{mode.redis_leaderboard}:{mode.stats_prefix}:{country.lower()}",
-        user_id,
-    )
-    country_rank = int(redis_country_rank) + 1 if redis_country_rank else 0
 
-    return RankInfo(global_rank, country_rank)
+def _parse_rank(redis_rank: Optional[int]) -> int:
+    # ZREVRANK is 0 based, with `None` meaning the user is not ranked.
+    return redis_rank + 1 if redis_rank is not None else 0
 
 
-async def full_recalc(stats: Stats) -> None:
-    db_scores = await app.state.services.database.fetch_all(
-        f"SELECT s.accuracy, s.pp FROM {stats.mode.scores_table} s RIGHT JOIN beatmaps b USING(beatmap_md5) "
-        "WHERE s.completed = 3 AND s.play_mode = :mode AND b.ranked IN (3, 2) AND s.userid = :id ORDER BY s.pp DESC LIMIT 100",
-        {"mode": stats.mode.as_vn, "id": stats.user_id},
-    )
+async def get_redis_rank(user_id: int, mode: Mode) -> RankInfo:
+    display_info = await app.usecases.display_info.fetch(user_id)
+    global_key, country_key = _rank_keys(mode, display_info.country)
+
+    pipeline = app.state.services.redis.pipeline(transaction=False)
+    pipeline.zrevrank(global_key, user_id)
+    pipeline.zrevrank(country_key, user_id)
+    global_rank, country_rank = await pipeline.execute()
 
-    total_acc = 0.0
-    total_pp = 0.0
-    last_idx = 0
+    return RankInfo(_parse_rank(global_rank), _parse_rank(country_rank))
 
-    for idx, score in enumerate(db_scores):
-        total_pp += score["pp"] * (0.95**idx)
-        total_acc += score["accuracy"] * (0.95**idx)
-        last_idx = idx
 
-    stats.accuracy = (total_acc * (100.0 / (20 * (1 - 0.95 ** (last_idx + 1))))) / 100
-    stats.pp = total_pp + await calc_bonus(stats)
+TOP_SCORES_CACHE: LRUCache[tuple[int, Mode], TopScores] = LRUCache(
+    max_size=settings.TOP_SCORES_CACHE_SIZE,
+    ttl=settings.TOP_SCORES_CACHE_TTL,
+)
 
 
-async def calc_bonus(stats: Stats) -> float:
-    count = await app.state.services.database.fetch_val(
+async def fetch_top_scores(user_id: int, mode: Mode) -> TopScores:
+    """Loads a user's top scores from the database, replacing any cached
+    ones."""
+
+    db_scores = await app.state.services.database.fetch_all(
+        f"SELECT s.accuracy, s.pp, s.beatmap_md5 FROM {mode.scores_table} s RIGHT JOIN beatmaps b USING(beatmap_md5) "
+        "WHERE s.completed = 3 AND s.play_mode = :mode AND b.ranked IN (3, 2) AND s.userid = :id ORDER BY s.pp DESC LIMIT 100",
+        {"mode": mode.as_vn, "id": user_id},
+    )
+
+    ranked_count = await app.state.services.database.fetch_val(
         (
-            f"SELECT COUNT(*) FROM {stats.mode.scores_table} s RIGHT JOIN beatmaps b USING(beatmap_md5) "
+            f"SELECT COUNT(*) FROM {mode.scores_table} s RIGHT JOIN beatmaps b USING(beatmap_md5) "
             "WHERE b.ranked IN (2, 3) AND s.completed = 3 AND s.play_mode = :mode AND s.userid = :id LIMIT 25397"
         ),
         {
-            "mode": stats.mode.as_vn,
-            "id": stats.user_id,
+            "mode": mode.as_vn,
+            "id": user_id,
         },
     )
 
-    stats._cur_bonus_pp = 416.6667 * (1 - (0.995 ** min(1000, count)))
-    return stats._cur_bonus_pp
+    top_scores = TopScores(
+        [
+            TopScore(db_score["pp"], db_score["accuracy"], db_score["beatmap_md5"])
+            for db_score in db_scores
+        ],
+        ranked_count,
+    )
+
+    TOP_SCORES_CACHE.set((user_id, mode), top_scores)
+    return top_scores
+
+
+def invalidate_top_scores(user_id: int, mode: Mode) -> None:
+    TOP_SCORES_CACHE.pop((user_id, mode))
+
+
+async def publish_top_scores_change(user_id: int, mode: Mode) -> None:
+    """Tells the other workers a user's top scores changed, so they drop
+    their now outdated copies."""
+
+    await app.state.services.redis.publish(
+        "ussr:top_scores_change",
+        orjson.dumps(
+            {
+                "user_id": user_id,
+                "mode": mode.value,
+                "origin": app.state.WORKER_ID,
+            },
+        ),
+    )
+
+
+def apply_top_scores(stats: Stats, top_scores: TopScores) -> None:
+    stats.accuracy = top_scores.accuracy
+    stats._cur_bonus_pp = top_scores.bonus_pp
+    stats.pp = top_scores.weighted_pp + stats._cur_bonus_pp
+
+
+async def full_recalc(stats: Stats) -> None:
+    top_scores = await fetch_top_scores(stats.user_id, stats.mode)
+    apply_top_scores(stats, top_scores)
+
+
+async def recalc_with_best(stats: Stats, score: Score, beatmap: Beatmap) -> None:
+    """Recalculates a user's pp and accuracy following a new best score,
+    without touching the database if their top scores are cached.
+
+    Note:
+        The score must already have been inserted, as it is included in the
+        top scores if they have to be loaded.
+    """
+
+    top_scores = TOP_SCORES_CACHE.get((stats.user_id, stats.mode))
+    if top_scores is None:
+        await full_recalc(stats)
+        return
+
+    if beatmap.status in (RankedStatus.RANKED, RankedStatus.APPROVED):
+        top_scores.replace(
+            TopScore(score.pp, score.acc, beatmap.md5),
+            has_previous=score.old_best is not None,
+        )
+
+        if not top_scores.complete:
+            await full_recalc(stats)
+            return
+
+    apply_top_scores(stats, top_scores)
 
 
 async def save(stats: Stats) -> None:
@@ -122,20 +196,18 @@ async def save(stats: Stats) -> None:
 
 
 async def update_rank(stats: Stats) -> None:
-    mode = stats.mode
-
-    await app.state.services.redis.zadd(
-        f"ripple:{mode.redis_leaderboard}:{mode.stats_prefix}",
-        {stats.user_id: stats.pp},
-    )
-
-    country = await app.usecases.countries.get_country(stats.user_id)
-    await app.state.services.redis.zadd(
-        f"ripple:{mode.redis_leaderboard}:{mode.stats_prefix}:{country.lower()}",
-        {stats.user_id: stats.pp},
-    )
-
-    stats.rank, stats.country_rank = await get_redis_rank(stats.user_id, mode)
+    display_info = await app.usecases.display_info.fetch(stats.user_id)
+    global_key, country_key = _rank_keys(stats.mode, display_info.country)
+
+    pipeline = app.state.services.redis.pipeline(transaction=False)
+    pipeline.zadd(global_key, {stats.user_id: stats.pp})
+    pipeline.zadd(country_key, {stats.user_id: stats.pp})
+    pipeline.zrevrank(global_key, stats.user_id)
+    pipeline.zrevrank(country_key, stats.user_id)
+    *_, global_rank, country_rank = await pipeline.execute()
+
+    stats.rank = _parse_rank(global_rank)
+    stats.country_rank = _parse_rank(country_rank)
 
 
 async def refresh_stats(user_id: int) -> None:
@@ -7,20 +7,42 @@ from typing import Callable
 from typing import Optional
 
 import app.state.services
+import app.usecases.counters
 import app.usecases.discord
+import app.usecases.leaderboards
 import app.usecases.password
 import app.usecases.privileges
-import app.usecases.score
 import app.utils
 import logger
 import settings
 from app.constants.mode import Mode
 from app.constants.privileges import Privileges
-from app.models.beatmap import Beatmap
-from app.models.score import Score
 from app.models.user import User
+from app.objects.lru import LRUCache
 from fastapi import HTTPException
 
+# Friends are added and removed through the rest of the stack, which doesn't
+# tell us, so changes only show up on friend leaderboards once entries expire.
+FRIENDS_CACHE: LRUCache[int, frozenset[int]] = LRUCache(
+    max_size=settings.USER_INFO_CACHE_SIZE,
+    ttl=settings.FRIENDS_CACHE_TTL,
+)
+
+
+async def fetch_friends(user_id: int) -> frozenset[int]:
+    if (friends := FRIENDS_CACHE.get(user_id)) is not None:
+        return friends
+
+    db_friends = await app.state.services.database.fetch_all(
+        "SELECT user2 FROM users_relationships WHERE user1 = :id",
+        {"id": user_id},
+    )
+
+    friends = frozenset(relationship["user2"] for relationship in db_friends)
+    FRIENDS_CACHE.set(user_id, friends)
+
+    return friends
+
 
 async def fetch_db(username: str) -> Optional[User]:
     safe_name = app.utils.make_safe(username)
@@ -33,25 +55,13 @@ async def fetch_db(username: str) -> Optional[User]:
     if not db_user:
         return None
 
-    country = await app.state.services.database.fetch_val(
-        "SELECT country FROM users WHERE id = :id",
-        {"id": db_user["id"]},
-    )
-
-    db_friends = await app.state.services.database.fetch_all(
-        "SELECT user2 FROM users_relationships WHERE user1 = :id",
-        {"id": db_user["id"]},
-    )
-
-    friends = [relationship["user2"] for relationship in db_friends]
-
     return User(
         id=db_user["id"],
         name=db_user["username"],
         privileges=Privileges(db_user["privileges"]),
-        friends=friends,
+        friends=await fetch_friends(db_user["id"]),
         password_bcrypt=db_user["password_md5"],
-        country=country,
+        country=db_user["country"],
         coins=db_user["coins"],
     )
 
@@ -65,25 +75,13 @@ async def fetch_db_id(user_id: int) -> Optional[User]:
     if not db_user:
         return None
 
-    country = await app.state.services.database.fetch_val(
-        "SELECT country FROM users WHERE id = :id",
-        {"id": db_user["id"]},
-    )
-
-    db_friends = await app.state.services.database.fetch_all(
-        "SELECT user2 FROM users_relationships WHERE user1 = :id",
-        {"id": db_user["id"]},
-    )
-
-    friends = [relationship["user2"] for relationship in db_friends]
-
     return User(
         id=db_user["id"],
         name=db_user["username"],
         privileges=Privileges(db_user["privileges"]),
-        friends=friends,
+        friends=await fetch_friends(db_user["id"]),
         password_bcrypt=db_user["password_md5"],
-        country=country,
+        country=db_user["country"],
         coins=db_user["coins"],
     )
 
@@ -140,23 +138,18 @@ def authenticate_user(
 async def remove_from_leaderboard(user: User) -> None:
     uid = str(user.id)
 
+    pipeline = app.state.services.redis.pipeline(transaction=False)
     for mode in ("std", "taiko", "ctb", "mania"):
-        await app.state.services.redis.zrem(f"ripple:leaderboard:{mode}", uid)
-        await app.state.services.redis.zrem(f"ripple:leaderboard_relax:{mode}", uid)
-        await app.state.services.redis.zrem(f"ripple:leaderboard_ap:{mode}", uid)
+        pipeline.zrem(f"ripple:leaderboard:{mode}", uid)
+        pipeline.zrem(f"ripple:leaderboard_relax:{mode}", uid)
+        pipeline.zrem(f"ripple:leaderboard_ap:{mode}", uid)
 
         if user.country and (c := user.country.lower()) != "xx":
-            await app.state.services.redis.zrem(f"ripple:leaderboard:{mode}:{c}", uid)
+            pipeline.zrem(f"ripple:leaderboard:{mode}:{c}", uid)
+            pipeline.zrem(f"ripple:leaderboard_relax:{mode}:{c}", uid)
+            pipeline.zrem(f"ripple:leaderboard_ap:{mode}:{c}", uid)
 
-            await app.state.services.redis.zrem(
-                f"ripple:leaderboard_relax:{mode}:{c}",
-                uid,
-            )
-
-            await app.state.services.redis.zrem(
-                f"ripple:leaderboard_ap:{mode}:{c}",
-                uid,
-            )
+    await pipeline.execute()
 
 
 async def notify_ban(user: User) -> None:
@@ -208,6 +201,9 @@ async def restrict_user(
         },
     )
 
+    app.usecases.privileges.set_restricted(user.id, True)
+    app.usecases.leaderboards.clear_rendered()
+
     await insert_ban_log(user, summary, detail)
     await notify_ban(user)
     await remove_from_leaderboard(user)
@@ -232,24 +228,12 @@ async def unlock_achievement(user_id: int, ach_id: int) -> None:
     )
 
 
-async def increment_playtime(score: Score, beatmap: Beatmap) -> None:
-    await app.state.services.database.execute(
-        f"UPDATE {score.mode.stats_table} SET playtime_{score.mode.stats_prefix} = playtime_{score.mode.stats_prefix} + :new WHERE id = :id",
-        {
-            "new": app.usecases.score.get_non_computed_playtime(score, beatmap),
-            "id": score.user_id,
-        },
-    )
-
-
-async def increment_replays_watched(user_id: int, mode: Mode) -> None:
-    await app.state.services.database.execute(
-        "UPDATE users_stats SET replays_watched_{0} = replays_watched_{0} + 1 WHERE id = :id".format(
-            mode.stats_prefix,
-        ),
-        {
-            "id": user_id,
-        },
+def increment_replays_watched(user_id: int, mode: Mode) -> None:
+    app.usecases.counters.COUNTERS.add(
+        "users_stats",
+        "id",
+        f"replays_watched_{mode.stats_prefix}",
+        user_id,
     )
 
 
@@ -1,12 +1,20 @@
 from __future__ import annotations
 
+import asyncio
+import contextvars
+from typing import Any
+from typing import Coroutine
 from typing import Optional
+from typing import TypeVar
 from typing import Union
 
 import app.state
 import orjson
 
 
+T = TypeVar("T")
+
+
 def make_safe(username: str) -> str:
     return username.rstrip().lower().replace(" ", "_")
 
@@ -58,3 +66,16 @@ def ts_to_utc_ticks(ts: int) -> int:
     """
 
     return int(ts * 1e7) + 0x89F7FF5F7B58000
+
+
+def create_isolated_task(coro: Coroutine[Any, Any, T]) -> asyncio.Task[T]:
+    """Creates a task running within a fresh context.
+
+    Note:
+        `databases` stores the connection of a task within a context
+        variable, which child tasks inherit. Tasks created through this
+        acquire their own connection instead, so their queries may actually
+        run concurrently rather than queueing on the creator's connection.
+    """
+
+    return contextvars.Context().run(asyncio.create_task, coro)
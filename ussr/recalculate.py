@@ -0,0 +1,79 @@
+#!/usr/bin/env python3.9
+"""Recalculates the stats of every user (or the given users) in bulk.
+
+Usage:
+    python3.9 recalculate.py [--full] [--batch-size N] [user_id ...]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+
+import app.state.services
+import app.usecases.privileges
+import app.usecases.recalculation
+import app.utils
+import logger
+import uvloop
+
+uvloop.install()
+
+
+async def fetch_user_id_batches(batch_size: int) -> list[list[int]]:
+    user_ids = [
+        db_user["id"]
+        for db_user in await app.state.services.database.fetch_all(
+            "SELECT id FROM users ORDER BY id",
+        )
+    ]
+
+    return [
+        user_ids[idx : idx + batch_size] for idx in range(0, len(user_ids), batch_size)
+    ]
+
+
+async def recalculate(user_ids: list[int], full: bool, batch_size: int) -> None:
+    await app.state.services.database.connect()
+    await app.state.services.redis.initialize()
+
+    try:
+        await app.usecases.privileges.init_restricted_users()
+
+        if user_ids:
+            batches = [
+                user_ids[idx : idx + batch_size]
+                for idx in range(0, len(user_ids), batch_size)
+            ]
+        else:
+            batches = await fetch_user_id_batches(batch_size)
+
+        start = time.perf_counter_ns()
+        for idx, batch in enumerate(batches):
+            await app.usecases.recalculation.recalculate_users(batch, full=full)
+            logger.info(f"Recalculated batch {idx + 1}/{len(batches)}")
+
+        formatted_time = app.utils.format_time(time.perf_counter_ns() - start)
+        logger.info(f"Recalculated {len(batches)} batches in {formatted_time}!")
+    finally:
+        await app.state.services.database.disconnect()
+        await app.state.services.redis.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Recalculates user stats in bulk.")
+    parser.add_argument("user_ids", type=int, nargs="*")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="also recalculate playcount, max combo, total score and ranked score",
+    )
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    asyncio.run(recalculate(args.user_ids, args.full, args.batch_size))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
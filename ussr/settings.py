@@ -42,12 +42,23 @@ MEILI_KEY = os.environ["MEILI_KEY"]
 DATA_BEATMAP_DIRECTORY = os.environ["DATA_BEATMAP_DIRECTORY"]
 DATA_SCREENSHOT_DIRECTORY = os.environ["DATA_SCREENSHOT_DIRECTORY"]
 DATA_REPLAY_DIRECTORY = os.environ["DATA_REPLAY_DIRECTORY"]
+DATA_BEATMAP_ARCHIVE_DIRECTORY = os.environ["DATA_BEATMAP_ARCHIVE_DIRECTORY"]
+BEATMAP_FILE_INDEX_PATH = os.environ["BEATMAP_FILE_INDEX_PATH"]
+BEATMAP_FILE_INDEX_SAVE_INTERVAL = int(os.environ["BEATMAP_FILE_INDEX_SAVE_INTERVAL"])
+BEATMAP_DOWNLOAD_CONCURRENCY = int(os.environ["BEATMAP_DOWNLOAD_CONCURRENCY"])
+BEATMAP_FILE_MAX_IDLE = int(os.environ["BEATMAP_FILE_MAX_IDLE"])
+BEATMAP_FILE_PRUNE_INTERVAL = int(os.environ["BEATMAP_FILE_PRUNE_INTERVAL"])
 
 # API Configuration
 API_KEYS_POOL = _parse_string_list(os.environ["API_KEYS_POOL"])
 API_FALLBACK_URL = os.environ["API_FALLBACK_URL"]
 API_OSU_FALLBACK_URL = os.environ["API_OSU_FALLBACK_URL"]
 DIRECT_URL = os.environ["DIRECT_URL"]
+API_TIMEOUT = float(os.environ["API_TIMEOUT"])
+API_KEY_RATE_LIMIT = int(os.environ["API_KEY_RATE_LIMIT"])
+API_KEY_WAIT = float(os.environ["API_KEY_WAIT"])
+API_CIRCUIT_FAILURES = int(os.environ["API_CIRCUIT_FAILURES"])
+API_CIRCUIT_COOLDOWN = float(os.environ["API_CIRCUIT_COOLDOWN"])
 
 # Server Information
 PS_DOMAIN = os.environ["SRV_URL"]
@@ -63,8 +74,37 @@ DISCORD_ADMIN_HOOK = os.environ["DISCORD_ADMIN_HOOK"]
 # WebSocket Configuration
 WS_WRITE_KEY = os.environ["WS_WRITE_KEY"]
 
+# Leaderboard Cache Configuration
+LEADERBOARD_CACHE_SIZE = int(os.environ["LEADERBOARD_CACHE_SIZE"])
+LEADERBOARD_CACHE_TTL = int(os.environ["LEADERBOARD_CACHE_TTL"])
+REDIS_LEADERBOARDS = _parse_bool(os.environ["REDIS_LEADERBOARDS"])
+LEADERBOARD_PRELOAD_COUNT = int(os.environ["LEADERBOARD_PRELOAD_COUNT"])
+LEADERBOARD_PRELOAD_CONCURRENCY = int(os.environ["LEADERBOARD_PRELOAD_CONCURRENCY"])
+
+# Beatmap Cache Configuration
+BEATMAP_CACHE_SIZE = int(os.environ["BEATMAP_CACHE_SIZE"])
+BEATMAP_CACHE_UNRANKED_TTL = int(os.environ["BEATMAP_CACHE_UNRANKED_TTL"])
+BEATMAP_REFRESH_CONCURRENCY = int(os.environ["BEATMAP_REFRESH_CONCURRENCY"])
+BEATMAP_REFRESH_QUEUE_SIZE = int(os.environ["BEATMAP_REFRESH_QUEUE_SIZE"])
+
+# User Info Cache Configuration
+USER_INFO_CACHE_SIZE = int(os.environ["USER_INFO_CACHE_SIZE"])
+USER_INFO_CACHE_TTL = int(os.environ["USER_INFO_CACHE_TTL"])
+FRIENDS_CACHE_TTL = int(os.environ["FRIENDS_CACHE_TTL"])
+TOP_SCORES_CACHE_SIZE = int(os.environ["TOP_SCORES_CACHE_SIZE"])
+TOP_SCORES_CACHE_TTL = int(os.environ["TOP_SCORES_CACHE_TTL"])
+
+# Write Batching Configuration
+JOURNAL_PATH = os.environ["JOURNAL_PATH"]
+JOURNAL_FLUSH_INTERVAL = float(os.environ["JOURNAL_FLUSH_INTERVAL"])
+COUNTERS_FLUSH_INTERVAL = float(os.environ["COUNTERS_FLUSH_INTERVAL"])
+
 # Performance Service Configuration
 PERFORMANCE_SERVICE_URL = os.environ["PERFORMANCE_SERVICE_URL"]
+PERFORMANCE_SERVICE_TIMEOUT = float(os.environ["PERFORMANCE_SERVICE_TIMEOUT"])
+PERFORMANCE_BATCH_SIZE = int(os.environ["PERFORMANCE_BATCH_SIZE"])
+PERFORMANCE_BATCH_WINDOW = float(os.environ["PERFORMANCE_BATCH_WINDOW"])
+PERFORMANCE_MAX_PENDING = int(os.environ["PERFORMANCE_MAX_PENDING"])
 
 # S3 Configuration
 S3_ENABLED = _parse_bool(os.environ["S3_ENABLED"])
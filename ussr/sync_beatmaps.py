@@ -0,0 +1,283 @@
+#!/usr/bin/env python3.9
+"""Imports beatmaps in bulk, either from the osu!api or a local dump of
+`get_beatmaps` responses (a JSON array, or one beatmap per line).
+
+Progress is saved to the checkpoint file after every batch, so an
+interrupted sync continues where it stopped when ran again.
+
+Note:
+    The osu!api only lists beatmaps ranked, approved or loved since the
+    given date, so other beatmaps are still only saved once played.
+
+Usage:
+    python3.9 sync_beatmaps.py [--since DATE] [--checkpoint PATH] [--batch-size N]
+    python3.9 sync_beatmaps.py --dump PATH [--checkpoint PATH] [--batch-size N]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime
+from datetime import timedelta
+from typing import Any
+from typing import Iterator
+from typing import Optional
+
+import aiohttp
+import app.state.services
+import app.usecases.beatmap
+import app.usecases.osu_api
+import app.utils
+import logger
+import orjson
+import uvloop
+
+uvloop.install()
+
+# The most beatmaps returned by a single `get_beatmaps` request.
+API_PAGE_SIZE = 500
+
+# The osu!api's (MySQL) date format.
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# How many times fetching or saving a page is attempted before giving up.
+PAGE_ATTEMPTS = 5
+
+# Seconds waited before the first retry of a page, doubled after each one.
+RETRY_DELAY = 5.0
+
+
+def read_checkpoint(path: str) -> dict[str, Any]:
+    try:
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+    except FileNotFoundError:
+        return {}
+
+
+def write_checkpoint(path: str, checkpoint: dict[str, Any]) -> None:
+    # written to a temporary file first, so a crash never leaves a torn one.
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(orjson.dumps(checkpoint))
+
+    os.replace(temp_path, path)
+
+
+async def _save_batch(response_json: list[dict[str, Any]]) -> None:
+    beatmaps = app.usecases.beatmap.parse_from_osu_api(response_json)
+    changed_md5s = await app.usecases.beatmap.save_many(beatmaps)
+
+    # let running servers drop their outdated copies.
+    for md5 in changed_md5s:
+        await app.state.services.redis.publish("ussr:refresh_bmap", md5)
+
+
+async def save_batch(response_json: list[dict[str, Any]]) -> None:
+    """Saves a batch of beatmaps, retrying it on failure. Saving is an upsert,
+    so a batch which partially saved is saved again as a whole."""
+
+    delay = RETRY_DELAY
+    for attempt in range(1, PAGE_ATTEMPTS + 1):
+        try:
+            await _save_batch(response_json)
+            return
+        except Exception as e:
+            if attempt == PAGE_ATTEMPTS:
+                raise
+
+            logger.warning(
+                f"Failed to save a batch of beatmaps ({e}), retrying in {delay} "
+                "seconds.",
+            )
+            await asyncio.sleep(delay)
+            delay *= 2
+
+
+async def fetch_page(since: datetime) -> Optional[list[dict[str, Any]]]:
+    """Fetches the beatmaps approved since `since`, retrying while the
+    osu!api can't be reached. Returns `None` if it never could be."""
+
+    delay = RETRY_DELAY
+    for attempt in range(1, PAGE_ATTEMPTS + 1):
+        response_json = await app.usecases.osu_api.get_beatmaps(
+            {"since": since.strftime(DATE_FORMAT), "limit": API_PAGE_SIZE},
+        )
+        if response_json is not None:
+            return response_json
+
+        if attempt < PAGE_ATTEMPTS:
+            logger.warning(
+                f"The osu!api could not be reached, retrying in {delay} seconds.",
+            )
+            await asyncio.sleep(delay)
+            delay *= 2
+
+    return None
+
+
+def _cursor(beatmap_json: dict[str, Any]) -> tuple[datetime, int]:
+    return (
+        datetime.strptime(beatmap_json["approved_date"], DATE_FORMAT),
+        int(beatmap_json["beatmap_id"]),
+    )
+
+
+async def sync_from_api(
+    cursor: tuple[datetime, int],
+    checkpoint_path: str,
+) -> int:
+    """Syncs every beatmap approved after `cursor`, an (approval date, beatmap
+    id) pair, as beatmaps may share an approval date."""
+
+    saved = 0
+
+    while True:
+        # a second earlier, so beatmaps sharing the cursor's date are included
+        # whether the osu!api's `since` is inclusive or not.
+        response_json = await fetch_page(cursor[0] - timedelta(seconds=1))
+        if response_json is None:
+            logger.error(
+                "The osu!api could not be reached, stopping the sync. Run it "
+                "again to continue from the last checkpoint.",
+            )
+            return saved
+
+        new_beatmaps = [
+            beatmap_json
+            for beatmap_json in response_json
+            if _cursor(beatmap_json) > cursor
+        ]
+        if not new_beatmaps:
+            if len(response_json) < API_PAGE_SIZE:
+                return saved
+
+            # a whole page of beatmaps approved before the cursor's second,
+            # which the osu!api offers no way to page past.
+            logger.warning(
+                f"More than {API_PAGE_SIZE} beatmaps were approved at "
+                f"{cursor[0]}, some of which may have been skipped.",
+            )
+            cursor = (cursor[0] + timedelta(seconds=1), 0)
+            continue
+
+        await save_batch(new_beatmaps)
+        saved += len(new_beatmaps)
+
+        cursor = max(_cursor(beatmap_json) for beatmap_json in new_beatmaps)
+        write_checkpoint(
+            checkpoint_path,
+            {"since": cursor[0].strftime(DATE_FORMAT), "beatmap_id": cursor[1]},
+        )
+        logger.info(f"Synced {saved} beatmaps (up to {cursor[0]}).")
+
+        if len(response_json) < API_PAGE_SIZE:
+            return saved
+
+
+def read_dump(path: str) -> Iterator[dict[str, Any]]:
+    with open(path, "rb") as f:
+        contents = f.read()
+
+    if contents.lstrip().startswith(b"["):
+        yield from orjson.loads(contents)
+        return
+
+    for line in contents.splitlines():
+        if line.strip():
+            yield orjson.loads(line)
+
+
+async def sync_from_dump(path: str, checkpoint_path: str, batch_size: int) -> int:
+    # a checkpoint of another dump (or of the osu!api) is ignored.
+    checkpoint = read_checkpoint(checkpoint_path)
+    offset = checkpoint.get("offset", 0) if checkpoint.get("dump") == path else 0
+    if offset:
+        logger.info(f"Continuing from beatmap {offset}.")
+
+    saved = 0
+    batch: list[dict[str, Any]] = []
+    for idx, response_json in enumerate(read_dump(path)):
+        if idx < offset:
+            continue
+
+        batch.append(response_json)
+        if len(batch) < batch_size:
+            continue
+
+        await save_batch(batch)
+        saved += len(batch)
+        batch = []
+
+        write_checkpoint(checkpoint_path, {"dump": path, "offset": idx + 1})
+        logger.info(f"Synced {offset + saved} beatmaps.")
+
+    if batch:
+        await save_batch(batch)
+        saved += len(batch)
+        write_checkpoint(checkpoint_path, {"dump": path, "offset": offset + saved})
+
+    return saved
+
+
+async def sync(
+    since: Optional[datetime],
+    dump_path: Optional[str],
+    checkpoint_path: str,
+    batch_size: int,
+) -> None:
+    await app.state.services.database.connect()
+    await app.state.services.redis.initialize()
+    app.state.services.http = aiohttp.ClientSession(
+        json_serialize=lambda x: orjson.dumps(x).decode(),
+    )
+
+    try:
+        start = time.perf_counter_ns()
+
+        if dump_path is not None:
+            saved = await sync_from_dump(dump_path, checkpoint_path, batch_size)
+        else:
+            if since is not None:
+                cursor = (since, 0)
+            else:
+                checkpoint = read_checkpoint(checkpoint_path)
+                cursor = (
+                    datetime.strptime(
+                        checkpoint.get("since", "2007-01-01 00:00:00"),
+                        DATE_FORMAT,
+                    ),
+                    checkpoint.get("beatmap_id", 0),
+                )
+
+            saved = await sync_from_api(cursor, checkpoint_path)
+
+        formatted_time = app.utils.format_time(time.perf_counter_ns() - start)
+        logger.info(f"Synced {saved} beatmaps in {formatted_time}!")
+    finally:
+        await app.state.services.http.close()
+        await app.state.services.database.disconnect()
+        await app.state.services.redis.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Imports beatmaps in bulk.")
+    parser.add_argument(
+        "--since",
+        type=lambda date: datetime.strptime(date, "%Y-%m-%d"),
+        help="sync beatmaps approved since this date (YYYY-MM-DD) rather than "
+        "since the last sync",
+    )
+    parser.add_argument("--dump", help="sync from a dump rather than the osu!api")
+    parser.add_argument("--checkpoint", default="beatmap_sync.json")
+    parser.add_argument("--batch-size", type=int, default=API_PAGE_SIZE)
+    args = parser.parse_args()
+
+    asyncio.run(sync(args.since, args.dump, args.checkpoint, args.batch_size))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())